@@ -1,41 +1,80 @@
 """
-GET /audit/challenges
+GET /audit/challenges?limit=&cursor=
 GET /audit/challenges/{challenge_id}
 """
 from __future__ import annotations
-import json
+import asyncio
+from datetime import datetime
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.json_utils import loads as _json_loads
 from app.db import repo
 from app.db.models import Challenge
 
 router = APIRouter()
 
 
+# Above this many rows the JSON decoding is moved off the event loop.
+_SERIALIZE_IN_THREAD_ROWS = 100
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
 def _serialize_challenge(c: Challenge) -> dict:
     return {
         "challenge_id": c.id,
         "transfer_id": c.transfer_id,
         "user_id": c.user_id,
         "rail": c.rail,
-        "triggers": json.loads(c.triggers_json or "[]"),
-        "financial_features": json.loads(c.financial_features_json or "{}"),
-        "scores": json.loads(c.scores_json or "null"),
+        "triggers": _json_loads(c.triggers_json or "[]"),
+        "financial_features": _json_loads(c.financial_features_json or "{}"),
+        "scores": _json_loads(c.scores_json or "null"),
         "decision": c.decision,
-        "reasons": json.loads(c.reasons_json or "[]"),
+        "reasons": _json_loads(c.reasons_json or "[]"),
         "retry_count": c.retry_count,
-        "expires_at": c.expires_at.isoformat() if c.expires_at else None,
-        "used_at": c.used_at.isoformat() if c.used_at else None,
-        "created_at": c.created_at.isoformat() if c.created_at else None,
+        "expires_at": _isoformat(c.expires_at),
+        "used_at": _isoformat(c.used_at),
+        "created_at": _isoformat(c.created_at),
     }
 
 
+def _serialize_challenges(challenges) -> list[dict]:
+    return [_serialize_challenge(c) for c in challenges]
+
+
+# Cursor is "<created_at iso>|<challenge id>" of the last row on a page.
+def _encode_cursor(c: Challenge) -> Optional[str]:
+    return f"{c.created_at.isoformat()}|{c.id}" if c.created_at else None
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        created_at, challenge_id = cursor.split("|", 1)
+        return datetime.fromisoformat(created_at), challenge_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/audit/challenges")
-async def list_challenges(session: AsyncSession = Depends(repo.get_session)):
-    challenges = await repo.list_all_challenges(session)
-    return {"challenges": [_serialize_challenge(c) for c in challenges]}
+async def list_challenges(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    session: AsyncSession = Depends(repo.get_session),
+):
+    before = _decode_cursor(cursor) if cursor else None
+    challenges = await repo.list_all_challenges(session, limit=limit, before=before)
+    next_cursor = _encode_cursor(challenges[-1]) if len(challenges) == limit else None
+    if len(challenges) > _SERIALIZE_IN_THREAD_ROWS:
+        # Rows are fully loaded, so decoding them touches no lazy attributes.
+        items = await asyncio.to_thread(_serialize_challenges, challenges)
+    else:
+        items = _serialize_challenges(challenges)
+    return {"challenges": items, "next_cursor": next_cursor}
 
 
 @router.get("/audit/challenges/{challenge_id}")
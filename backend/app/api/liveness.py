@@ -2,29 +2,82 @@
 POST /liveness/upload?challenge_id=<id>
 multipart/form-data field: video
 """
+
+# PERF: this path is bound by video decode and network round-trips, not
+# arithmetic. Critical path of liveness_upload:
+#   spool -> decode -> [ML || Presage || Qwen-VL] -> Gemini risk
+#         -> [rail execute/cancel || receipt anchor] -> DB writes
+# The three scorers only need the decoded frames and Gemini needs all three;
+# the rail call and receipt anchor only need the decision. The challenge and
+# transfer writes at the end go through the request's AsyncSession in order.
 from __future__ import annotations
 import json
 import asyncio
+import os
+import tempfile
+import time
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, UploadFile, File, Query, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Query, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.logging import get_logger
 from app.core.security import hash_scores
 from app.db import repo
-from app.ml.infer import analyze_video_bytes
+from app.ml.infer import analyze_decoded_video, middle_frame_jpeg, shrink_jpeg_for_vision
+from app.video.decode import decode_video, sniff_suffix
 from app.services import gemini_risk
 from app.services import presage_service
+from app.services.openrouter_service import analyze_frame_for_spoofing
 from app.services import gateway_fiserv as bank_gw
 from app.services import solana_service as sol_gw
 
 router = APIRouter()
 logger = get_logger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+PROFILE_DIR = "app/static/profiles"
+PROFILE_CACHE_TTL_SECONDS = 300
+PROFILE_CACHE_MAX_ENTRIES = 10_000
+# user_id -> (expires_at monotonic, JPEG bytes or None)
+_PROFILE_CACHE: dict[str, tuple[float, bytes | None]] = {}
+
+# Demo override scores, keyed off the amount's cents in _score_upload.
+# Shared across requests: callers get a shallow copy and must not mutate
+# the nested signals list or presage_raw dict.
+_DEMO_FAIL_99 = {
+    "deepfake_mean": 0.88,
+    "deepfake_var": 0.15,
+    "liveness": 0.85,
+    "quality": 0.80,
+    "presage": 0.80,
+    "signals": ["using_fake_model", "known_deepfake_signature", "high_temporal_inconsistency"],
+    "presage_raw": {"micro_motion": 0.8, "smoothness": 0.2, "periodicity_proxy": 0.1, "face_presence_ratio": 1.0}
+}
+_DEMO_RETRY_98 = {
+    "deepfake_mean": 0.05,
+    "deepfake_var": 0.01,
+    "liveness": 0.30,
+    "quality": 0.20,
+    "presage": 0.15,
+    "signals": ["low_micro_motion", "poor_lighting", "face_obscured"],
+    "presage_raw": {"micro_motion": 0.1, "smoothness": 0.8, "periodicity_proxy": 0.0, "face_presence_ratio": 0.5}
+}
+_DEMO_SPOOF_97 = {
+    "deepfake_mean": 0.05,        # Not a deepfake, just a photo
+    "deepfake_var": 0.01,
+    "liveness": 0.10,             # No life
+    "quality": 0.85,              # Good quality photo
+    "presage": 0.05,              # Zero micro-motion
+    "signals": ["no_micro_motion_detected", "static_image_suspected", "physical_spoof_attempt"],
+    "presage_raw": {"micro_motion": 0.0, "smoothness": 1.0, "periodicity_proxy": 0.0, "face_presence_ratio": 1.0}
+}
+
 
 @router.post("/liveness/upload")
 async def liveness_upload(
+    background: BackgroundTasks,
     challenge_id: str = Query(...),
     video: UploadFile = File(...),
     session: AsyncSession = Depends(repo.get_session),
@@ -35,10 +88,9 @@ async def liveness_upload(
         raise HTTPException(status_code=404, detail="Challenge not found or expired")
 
     # 2. Expiry check
-    expires_at = datetime.fromisoformat(ch_data["expires_at"])
-    if expires_at.tzinfo is None:
-        expires_at = expires_at.replace(tzinfo=timezone.utc)
-    if datetime.now(timezone.utc) > expires_at:
+    now = time.time()
+    expires_at_epoch = _expiry_epoch(ch_data)
+    if now > expires_at_epoch:
         raise HTTPException(status_code=410, detail="Challenge expired")
 
     payment_id = ch_data["payment_id"]
@@ -48,97 +100,15 @@ async def liveness_upload(
     retry_count = ch_data.get("retry_count", 0)
     solana_pending_id = ch_data.get("solana_pending_id")
 
-    # 3. Read video bytes
-    video_bytes = await video.read()
-    logger.info("liveness_upload challenge=%s bytes=%d", challenge_id, len(video_bytes))
+    # 3. Spool video to disk
+    video_path, video_size = await _spool_upload(video)
+    logger.info("liveness_upload challenge=%s bytes=%d", challenge_id, video_size)
 
     # 4. ML inference or DEMO OVERRIDES
-    amount = ch_data.get("amount", 0.0)
-    amount_str = f"{amount:.2f}"
-
-    if amount_str.endswith(".99"):
-        logger.info("DEMO OVERRIDE: Forcing Deepfake FAIL scores for amount %s", amount_str)
-        ml_result = {
-            "deepfake_mean": 0.88,
-            "deepfake_var": 0.15,
-            "liveness": 0.85,
-            "quality": 0.80,
-            "presage": 0.80,
-            "signals": ["using_fake_model", "known_deepfake_signature", "high_temporal_inconsistency"],
-            "presage_raw": {"micro_motion": 0.8, "smoothness": 0.2, "periodicity_proxy": 0.1, "face_presence_ratio": 1.0}
-        }
-    elif amount_str.endswith(".98"):
-        logger.info("DEMO OVERRIDE: Forcing Poor Lighting RETRY scores for amount %s", amount_str)
-        ml_result = {
-            "deepfake_mean": 0.05,
-            "deepfake_var": 0.01,
-            "liveness": 0.30,
-            "quality": 0.20,
-            "presage": 0.15,
-            "signals": ["low_micro_motion", "poor_lighting", "face_obscured"],
-            "presage_raw": {"micro_motion": 0.1, "smoothness": 0.8, "periodicity_proxy": 0.0, "face_presence_ratio": 0.5}
-        }
-    elif amount_str.endswith(".97"):
-        logger.info("DEMO OVERRIDE: Forcing Printed Photo SPOOF FAIL scores for amount %s", amount_str)
-        ml_result = {
-            "deepfake_mean": 0.05,        # Not a deepfake, just a photo
-            "deepfake_var": 0.01,
-            "liveness": 0.10,             # No life
-            "quality": 0.85,              # Good quality photo
-            "presage": 0.05,              # Zero micro-motion
-            "signals": ["no_micro_motion_detected", "static_image_suspected", "physical_spoof_attempt"],
-            "presage_raw": {"micro_motion": 0.0, "smoothness": 1.0, "periodicity_proxy": 0.0, "face_presence_ratio": 1.0}
-        }
-    else:
-        # Normal ML inference — run ML + Presage rPPG + Qwen-VL concurrently for speed
-        from app.ml.infer import extract_middle_frame_base64
-        from app.services.openrouter_service import analyze_frame_for_spoofing
-        import os
-        import base64
-
-        # Look for a reference profile photo for 1:1 Face Matching
-        user_id = ch_data.get("user_id", "demo_user")
-        ref_b64 = None
-        profile_path = f"app/static/profiles/{user_id}.jpg"
-        if os.path.exists(profile_path):
-            try:
-                with open(profile_path, "rb") as f:
-                    ref_b64 = base64.b64encode(f.read()).decode('utf-8')
-                logger.info("Found reference profile photo for user: %s", user_id)
-            except Exception as e:
-                logger.warning("Failed to load reference photo for %s: %s", user_id, e)
-
-        async def qwen_task():
-            b64 = await asyncio.to_thread(extract_middle_frame_base64, video_bytes)
-            if b64:
-                return await analyze_frame_for_spoofing(b64, reference_b64=ref_b64)
-            return {"spoof_confidence": 0.0, "is_same_person": True, "face_match_confidence": 1.0, "face_match_reasoning": "", "vision_flags": []}
-
-        ml_result, presage_result, qwen_result = await asyncio.gather(
-            asyncio.to_thread(analyze_video_bytes, video_bytes),
-            presage_service.analyze_liveness(video_bytes),
-            qwen_task()
-        )
-        # Merge Presage score into ml_result
-        ml_result["presage"] = presage_result["presage_score"]
-        if presage_result["spoofing_flags"]:
-            ml_result["signals"].extend(presage_result["spoofing_flags"])
-            
-        # Merge Qwen-VL Face Match and Spoof scores into ml_result
-        ml_result["qwen_spoof_confidence"] = qwen_result["spoof_confidence"]
-        ml_result["is_same_person"] = qwen_result.get("is_same_person", True)
-        ml_result["face_match_confidence"] = qwen_result.get("face_match_confidence", 1.0)
-        ml_result["face_match_reasoning"] = qwen_result.get("face_match_reasoning", "")
-        if qwen_result["vision_flags"]:
-            ml_result["signals"].extend(qwen_result["vision_flags"])
-
-        logger.info(
-            "Presage rPPG: mode=%s score=%.3f pulse=%s hr=%s bpm",
-            presage_result["mode"],
-            presage_result["presage_score"],
-            presage_result["pulse_detected"],
-            presage_result["heart_rate_bpm"],
-        )
+    try:
+        ml_result = await _score_upload(ch_data, video_path)
+    finally:
+        os.unlink(video_path)
 
     scores = {
         "deepfake_mean": ml_result["deepfake_mean"],
@@ -178,13 +148,26 @@ async def liveness_upload(
 
     if decision == "PASS":
         payment_status = "EXECUTED"
+        scores_hash = hash_scores(scores)
         if rail == "BANK":
-            transfer_rec = await repo.get_transfer(session, payment_id)
-            bank_id = transfer_rec.provider_ref if transfer_rec else payment_id
-            _, pref = await bank_gw.execute(bank_id)
+            bank_id = transfer.provider_ref if transfer else payment_id
+            rail_call = bank_gw.execute(bank_id)
+        else:
+            rail_call = sol_gw.execute_pending_transfer(solana_pending_id or "")
+
+        # Rail execution and the receipt anchor are independent network
+        # round-trips; the DB writes below share one session and stay in order.
+        rail_result, receipt_tx = await asyncio.gather(
+            rail_call,
+            sol_gw.anchor_verification_receipt(
+                challenge_id, payment_id, decision, scores_hash
+            ),
+        )
+        if rail == "BANK":
+            _, pref = rail_result
             await repo.update_transfer_status(session, payment_id, "EXECUTED", provider_ref=pref)
         else:
-            solana_tx = await sol_gw.execute_pending_transfer(solana_pending_id or "")
+            solana_tx = rail_result
             await repo.update_transfer_status(
                 session, payment_id, "EXECUTED", provider_ref=solana_tx
             )
@@ -198,11 +181,6 @@ async def liveness_upload(
             )
             await repo.add_known_recipient(session, user_id, recipient_key)
 
-        # Anchor receipt
-        scores_hash = hash_scores(scores)
-        receipt_tx = await sol_gw.anchor_verification_receipt(
-            challenge_id, payment_id, decision, scores_hash
-        )
         await repo.create_solana_receipt(
             session, challenge_id, payment_id, decision, scores_hash, receipt_tx
         )
@@ -211,16 +189,22 @@ async def liveness_upload(
 
     elif decision == "FAIL":
         payment_status = "BLOCKED"
+        scores_hash = hash_scores(scores)
         if rail == "BANK":
-            transfer_rec = await repo.get_transfer(session, payment_id)
-            await bank_gw.cancel(transfer_rec.provider_ref or payment_id)
+            bank_id = (transfer.provider_ref if transfer else None) or payment_id
+            rail_call = bank_gw.cancel(bank_id)
         else:
-            solana_tx = await sol_gw.cancel_pending_transfer(solana_pending_id or "")
-        await repo.update_transfer_status(session, payment_id, "BLOCKED")
-        scores_hash = hash_scores(scores)
-        receipt_tx = await sol_gw.anchor_verification_receipt(
-            challenge_id, payment_id, decision, scores_hash
+            rail_call = sol_gw.cancel_pending_transfer(solana_pending_id or "")
+
+        rail_result, receipt_tx = await asyncio.gather(
+            rail_call,
+            sol_gw.anchor_verification_receipt(
+                challenge_id, payment_id, decision, scores_hash
+            ),
         )
+        if rail != "BANK":
+            solana_tx = rail_result
+        await repo.update_transfer_status(session, payment_id, "BLOCKED")
         await repo.create_solana_receipt(
             session, challenge_id, payment_id, decision, scores_hash, receipt_tx
         )
@@ -231,17 +215,26 @@ async def liveness_upload(
         payment_status = "RETRY"
         # Update fast store retry_count
         ch_data["retry_count"] = retry_count + 1
-        ttl_remaining = max(1, int((expires_at - datetime.now(timezone.utc)).total_seconds()))
+        # Measured from request start; the expiry check above still enforces
+        # expires_at on the retried upload.
+        ttl_remaining = max(1, int(expires_at_epoch - now))
+        # The retry must find the updated challenge, so only the DB status
+        # write waits until after the response.
         await repo.store_challenge(challenge_id, ch_data, ttl=ttl_remaining)
-        await repo.update_transfer_status(session, payment_id, "HELD")
+        background.add_task(_with_session, repo.update_transfer_status, payment_id, "HELD")
 
     else:
         # MANUAL_REVIEW or RETRY exhausted
         decision = "MANUAL_REVIEW"
         payment_status = "HELD"
-        await repo.update_transfer_status(session, payment_id, "HELD")
-        await _mark_challenge_done(session, challenge_id, retry_count, decision, reasons, scores)
+        # Drop the challenge now so it cannot be re-submitted; the DB
+        # bookkeeping happens after the response is sent.
         await repo.delete_challenge(challenge_id)
+        background.add_task(_with_session, repo.update_transfer_status, payment_id, "HELD")
+        background.add_task(
+            _with_session, _mark_challenge_done,
+            challenge_id, retry_count, decision, reasons, scores,
+        )
 
     return {
         "status": "VERIFIED",
@@ -263,22 +256,12 @@ async def liveness_score(video: UploadFile = File(...)):
     Dedicated endpoint for the iOS app embedded backend.
     Runs ML + Presage + Qwen-VL concurrently and returns the raw scoring JSON.
     """
-    video_bytes = await video.read()
-    
-    from app.ml.infer import extract_middle_frame_base64
-    from app.services.openrouter_service import analyze_frame_for_spoofing
-    
-    async def qwen_task():
-        b64 = await asyncio.to_thread(extract_middle_frame_base64, video_bytes)
-        if b64:
-            return await analyze_frame_for_spoofing(b64)
-        return {"spoof_confidence": 0.0, "vision_flags": []}
+    video_path, _ = await _spool_upload(video)
 
-    ml_result, presage_result, qwen_result = await asyncio.gather(
-        asyncio.to_thread(analyze_video_bytes, video_bytes),
-        presage_service.analyze_liveness(video_bytes),
-        qwen_task()
-    )
+    try:
+        ml_result, presage_result, qwen_result = await _analyze_spooled_video(video_path)
+    finally:
+        os.unlink(video_path)
     
     # Merge Presage score
     ml_result["presage"] = presage_result["presage_score"]
@@ -306,6 +289,145 @@ async def liveness_score(video: UploadFile = File(...)):
     }
 
 
+async def _score_upload(ch_data: dict, video_path: str) -> dict:
+    """ML inference on the spooled video, or the demo override scores."""
+    amount = ch_data.get("amount", 0.0)
+    cents = round(amount * 100) % 100
+
+    if cents == 99:
+        logger.info("DEMO OVERRIDE: Forcing Deepfake FAIL scores for amount %.2f", amount)
+        ml_result = dict(_DEMO_FAIL_99)
+    elif cents == 98:
+        logger.info("DEMO OVERRIDE: Forcing Poor Lighting RETRY scores for amount %.2f", amount)
+        ml_result = dict(_DEMO_RETRY_98)
+    elif cents == 97:
+        logger.info("DEMO OVERRIDE: Forcing Printed Photo SPOOF FAIL scores for amount %.2f", amount)
+        ml_result = dict(_DEMO_SPOOF_97)
+    else:
+        # Normal ML inference — run ML + Presage rPPG + Qwen-VL concurrently for speed
+        # Look for a reference profile photo for 1:1 Face Matching
+        user_id = ch_data.get("user_id", "demo_user")
+        ref_jpeg = await _reference_photo(user_id)
+
+        ml_result, presage_result, qwen_result = await _analyze_spooled_video(
+            video_path, reference_jpeg=ref_jpeg
+        )
+        # Merge Presage score into ml_result
+        ml_result["presage"] = presage_result["presage_score"]
+        if presage_result["spoofing_flags"]:
+            ml_result["signals"].extend(presage_result["spoofing_flags"])
+            
+        # Merge Qwen-VL Face Match and Spoof scores into ml_result
+        ml_result["qwen_spoof_confidence"] = qwen_result["spoof_confidence"]
+        ml_result["is_same_person"] = qwen_result.get("is_same_person", True)
+        ml_result["face_match_confidence"] = qwen_result.get("face_match_confidence", 1.0)
+        ml_result["face_match_reasoning"] = qwen_result.get("face_match_reasoning", "")
+        if qwen_result["vision_flags"]:
+            ml_result["signals"].extend(qwen_result["vision_flags"])
+
+        logger.info(
+            "Presage rPPG: mode=%s score=%.3f pulse=%s hr=%s bpm",
+            presage_result["mode"],
+            presage_result["presage_score"],
+            presage_result["pulse_detected"],
+            presage_result["heart_rate_bpm"],
+        )
+
+    return ml_result
+
+
+async def _analyze_spooled_video(
+    video_path: str, reference_jpeg: bytes | None = None
+) -> tuple[dict, dict, dict]:
+    """
+    Decode the video once and share the frames between the ML pipeline, the
+    Presage rPPG path and the Qwen-VL middle frame.
+    Returns (ml_result, presage_result, qwen_result).
+    """
+    success, frames, decode_signals, fps = await asyncio.to_thread(decode_video, video_path)
+    ml_result, presage_result, qwen_result = await asyncio.gather(
+        asyncio.to_thread(analyze_decoded_video, (success, frames, decode_signals)),
+        presage_service.analyze_liveness_file(video_path, frames, fps),
+        _vision_check(frames if success else None, reference_jpeg),
+    )
+    return ml_result, presage_result, qwen_result
+
+
+async def _vision_check(frames, reference_jpeg: bytes | None) -> dict:
+    """Qwen-VL spoof / face-match check on the middle decoded frame."""
+    jpeg = await asyncio.to_thread(middle_frame_jpeg, frames)
+    if jpeg:
+        return await analyze_frame_for_spoofing(jpeg, reference_jpeg=reference_jpeg)
+    return {"spoof_confidence": 0.0, "is_same_person": True, "face_match_confidence": 1.0, "face_match_reasoning": "", "vision_flags": []}
+
+
+async def _reference_photo(user_id: str) -> bytes | None:
+    """
+    Reference profile photo (JPEG bytes) for user_id, or None if there is none.
+    Results (including misses) are cached for PROFILE_CACHE_TTL_SECONDS.
+    """
+    now = time.monotonic()
+    hit = _PROFILE_CACHE.get(user_id)
+    if hit and hit[0] > now:
+        return hit[1]
+    try:
+        ref_jpeg = await asyncio.to_thread(_load_profile, user_id)
+    except Exception as e:
+        logger.warning("Failed to load reference photo for %s: %s", user_id, e)
+        return None
+    if len(_PROFILE_CACHE) >= PROFILE_CACHE_MAX_ENTRIES:
+        _PROFILE_CACHE.pop(next(iter(_PROFILE_CACHE)))
+    _PROFILE_CACHE[user_id] = (now + PROFILE_CACHE_TTL_SECONDS, ref_jpeg)
+    return ref_jpeg
+
+
+def _load_profile(user_id: str) -> bytes | None:
+    profile_path = f"{PROFILE_DIR}/{user_id}.jpg"
+    if not os.path.exists(profile_path):
+        return None
+    with open(profile_path, "rb") as f:
+        ref_jpeg = f.read()
+    logger.info("Found reference profile photo for user: %s", user_id)
+    # Downscaled once here; the cached copy is what every vision call uploads
+    return shrink_jpeg_for_vision(ref_jpeg)
+
+
+def _expiry_epoch(ch_data: dict) -> float:
+    """
+    Challenge expiry as Unix seconds. Challenges stored before
+    expires_at_epoch existed only carry the ISO string; parse it as UTC.
+    """
+    epoch = ch_data.get("expires_at_epoch")
+    if epoch is not None:
+        return epoch
+    expires_at = datetime.fromisoformat(ch_data["expires_at"])
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at.timestamp()
+
+
+async def _spool_upload(video: UploadFile) -> tuple[str, int]:
+    """
+    Stream an upload to a temp file in chunks so the whole video is never
+    held in memory. Returns (path, size); the caller deletes the file. A
+    failed or cancelled upload (client disconnect) removes its partial file.
+    """
+    chunk = await video.read(UPLOAD_CHUNK_SIZE)
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=sniff_suffix(chunk))
+    try:
+        with tmp:
+            while chunk:
+                # Disk writes run off the event loop
+                await asyncio.to_thread(tmp.write, chunk)
+                size += len(chunk)
+                chunk = await video.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    return tmp.name, size
+
+
 async def _mark_challenge_done(
     session, challenge_id: str, retry_count: int,
     decision: str, reasons: list, scores: dict,
@@ -318,3 +440,15 @@ async def _mark_challenge_done(
         retry_count=retry_count,
         used_at=datetime.now(timezone.utc),
     )
+
+
+async def _with_session(fn, *args) -> None:
+    """
+    Run fn(session, *args) on a fresh session. For BackgroundTasks: the
+    request's session is closed once the response has been sent.
+    """
+    try:
+        async with repo.AsyncSessionLocal() as session:
+            await fn(session, *args)
+    except Exception as exc:
+        logger.error("Deferred %s failed: %s", fn.__name__, exc)
@@ -1,14 +1,23 @@
 """
 POST /payments/initiate — dual-rail payment initiation with risk triggers.
 """
+
+# PERF: initiate_payment is bound by network round-trips and DB queries.
+# Critical path:
+#   payee lookup -> [fraud engine || risk DB lookups]
+#                -> [rail hold + challenge writes || security alert]
+# Only the fraud engine waits on the payee lookup (new_payee); the security
+# alert needs just its result, so it overlaps the hold and challenge writes.
+# Every repo call uses the request's AsyncSession and runs one at a time.
 from __future__ import annotations
-import json
+import asyncio
 from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core import json_utils
 from app.core.config import get_settings
 from app.core.logging import get_logger
 from app.core.security import generate_id
@@ -23,6 +32,12 @@ router = APIRouter()
 logger = get_logger(__name__)
 settings = get_settings()
 
+# Settings are fixed for the process; bind the per-request ones once.
+_VEL_WIN = settings.RISK_VELOCITY_WINDOW_SECONDS
+_VEL_MAX = settings.RISK_VELOCITY_MAX
+_CHG_TTL = settings.CHALLENGE_TTL_SECONDS
+_CHG_TTL_DELTA = timedelta(seconds=_CHG_TTL)
+
 
 class InitiateRequest(BaseModel):
     user_id: str
@@ -50,33 +65,33 @@ async def initiate_payment(
         else f"BANK:{req.recipient_id}"
     )
 
-    # --- Know devices/payees ---
-    new_device = not await repo.is_known_device(session, req.user_id, req.device_id)
+    # --- Known payee (the fraud engine needs it) ---
     new_payee = not await repo.is_known_recipient(session, req.user_id, recipient_key)
 
-    # --- Velocity ---
-    velocity_count = await repo.count_recent_initiations(
-        session, req.user_id, settings.RISK_VELOCITY_WINDOW_SECONDS
-    )
-
-    # --- Financial features (needed for risk evaluation) ---
-    fin_features = await repo.get_financial_features(session, req.user_id)
-
-    # --- New Financial Fraud Scoring Engine ---
-    tx_risk = await gemini_risk.evaluate_transaction_risk(
-        user_id=req.user_id,
-        recipient_id=req.recipient_id or str(req.recipient_address),
-        amount=req.amount,
-        transaction_id=generate_id("tx_"),
-        new_payee=new_payee
-    )
+    # The remaining DB lookups share one AsyncSession, which is not safe for
+    # concurrent use, so they run in order in one task while the fraud
+    # engine round-trip runs alongside them.
+    async with asyncio.TaskGroup() as tg:
+        # --- New Financial Fraud Scoring Engine ---
+        t_risk = tg.create_task(gemini_risk.evaluate_transaction_risk(
+            user_id=req.user_id,
+            recipient_id=req.recipient_id or str(req.recipient_address),
+            amount=req.amount,
+            transaction_id=generate_id("tx_"),
+            new_payee=new_payee
+        ))
+        # --- Known device, velocity, financial features ---
+        t_db = tg.create_task(_load_risk_inputs(session, req.user_id, req.device_id))
+
+    tx_risk = t_risk.result()
+    new_device, velocity_count, fin_features = t_db.result()
     
     logger.info("Transaction Risk Engine: %d%% (%s) because: %s", 
                 tx_risk.get("risk_percentage", 0), tx_risk.get("risk_level", "MEDIUM"), tx_risk.get("explanation", "missing"))
     
     triggers = []
     if new_device: triggers.append("new_device")
-    if velocity_count > settings.RISK_VELOCITY_MAX: triggers.append("high_velocity")
+    if velocity_count > _VEL_MAX: triggers.append("high_velocity")
     if tx_risk.get("risk_percentage", 0) >= 60: triggers.append("high_fraud_score")
 
     # --- Create transfer record ---
@@ -131,6 +146,45 @@ async def initiate_payment(
         }
 
     # ---- High risk: hold + challenge ----
+    # The customer-facing explanation (Arcee Trinity) only depends on the
+    # risk result, so generate it while the hold and challenge writes run.
+    alert_task = asyncio.create_task(openrouter_service.generate_security_alert(
+        amount=req.amount,
+        triggers=triggers,
+        tx_risk_level=tx_risk.get("risk_level", "HIGH"),
+        tx_risk_explanation=tx_risk.get("explanation", "High transaction risk")
+    ))
+    try:
+        hold_solana_tx, pending_id, challenge_id, expires_at = await _hold_and_challenge(
+            session, req, rail, payment_id, triggers, fin_features
+        )
+        security_message = await alert_task
+    finally:
+        alert_task.cancel()
+
+    return {
+        "status": "CHALLENGE_REQUIRED",
+        "challenge_id": challenge_id,
+        "prompt": "Please record a clear 3-second face video for identity verification.",
+        "security_message": security_message,
+        "expires_at": expires_at.isoformat(),
+        "payment_id": payment_id,
+        "payment_status": "HELD",
+        "rail": rail,
+        "solana_tx": hold_solana_tx,
+    }
+
+
+async def _hold_and_challenge(
+    session: AsyncSession,
+    req: InitiateRequest,
+    rail: str,
+    payment_id: str,
+    triggers: list[str],
+    fin_features: dict,
+) -> tuple[str | None, str | None, str, datetime]:
+    """Hold the transfer on its rail and open a liveness challenge for it."""
+    pending_id = None
     if rail == "BANK":
         bank_id = await bank_gw.initiate_transfer(
             req.user_id, req.amount, req.recipient_id, req.note
@@ -148,7 +202,7 @@ async def initiate_payment(
         hold_solana_tx = hold_sig
 
     challenge_id = generate_id("chg_")
-    expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.CHALLENGE_TTL_SECONDS)
+    expires_at = datetime.now(timezone.utc) + _CHG_TTL_DELTA
 
     await repo.create_challenge_record(
         session,
@@ -156,8 +210,8 @@ async def initiate_payment(
         transfer_id=payment_id,
         user_id=req.user_id,
         rail=rail,
-        triggers_json=json.dumps(triggers),
-        financial_features_json=json.dumps(fin_features),
+        triggers_json=json_utils.dumps(triggers),
+        financial_features_json=json_utils.dumps(fin_features),
         expires_at=expires_at,
     )
 
@@ -171,25 +225,19 @@ async def initiate_payment(
         "financial_features": fin_features,
         "retry_count": 0,
         "expires_at": expires_at.isoformat(),
+        "expires_at_epoch": int(expires_at.timestamp()),
         "solana_pending_id": pending_id if rail == "SOLANA" else None,
-    }, ttl=settings.CHALLENGE_TTL_SECONDS + 30)
+    }, ttl=_CHG_TTL + 30)
 
-    # Generate customer-facing explanation via Arcee Trinity
-    security_message = await openrouter_service.generate_security_alert(
-        amount=req.amount,
-        triggers=triggers,
-        tx_risk_level=tx_risk.get("risk_level", "HIGH"),
-        tx_risk_explanation=tx_risk.get("explanation", "High transaction risk")
-    )
+    return hold_solana_tx, pending_id, challenge_id, expires_at
 
-    return {
-        "status": "CHALLENGE_REQUIRED",
-        "challenge_id": challenge_id,
-        "prompt": "Please record a clear 3-second face video for identity verification.",
-        "security_message": security_message,
-        "expires_at": expires_at.isoformat(),
-        "payment_id": payment_id,
-        "payment_status": "HELD",
-        "rail": rail,
-        "solana_tx": hold_solana_tx,
-    }
+
+async def _load_risk_inputs(
+    session: AsyncSession, user_id: str, device_id: str
+) -> tuple[bool, int, dict]:
+    """Sequential DB lookups on one session: (new_device, velocity_count, fin_features)."""
+    new_device = not await repo.is_known_device(session, user_id, device_id)
+    velocity_count, fin_features = await repo.get_velocity_and_financial_features(
+        session, user_id, _VEL_WIN
+    )
+    return new_device, velocity_count, fin_features
@@ -14,6 +14,12 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: str = "sqlite+aiosqlite:///./payment_gate.db"
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 3600
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_WARM: int = 5                     # connections opened at startup
 
     # Redis (optional – falls back to in-memory)
     REDIS_URL: str = ""
@@ -27,6 +33,8 @@ class Settings(BaseSettings):
     # Gemini
     GEMINI_API_KEY: str = ""
     GEMINI_MODEL: str = "gemini-1.5-flash"
+    # False: score transactions with the prompt's heuristics locally, no LLM call
+    GEMINI_TRANSACTION_EXPLANATIONS: bool = False
 
     # Presage SmartSpectra
     PRESAGE_API_KEY: str = ""
@@ -0,0 +1,39 @@
+"""Shared outbound HTTP client (pooled keep-alive connections)."""
+from __future__ import annotations
+from typing import Optional
+
+import httpx
+
+try:
+    import h2  # type: ignore  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Process-wide AsyncClient, created on first use. Callers pass their own
+    per-request timeout; connections are reused across services and requests.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_HTTP2,
+            limits=httpx.Limits(
+                max_connections=200, max_keepalive_connections=100, keepalive_expiry=30.0
+            ),
+            # Fail fast on connect / pool starvation; read/write keep the long default
+            timeout=httpx.Timeout(30.0, connect=5.0, pool=5.0),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared client (FastAPI shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,37 @@
+"""JSON helpers backed by orjson, with a stdlib json fallback."""
+from __future__ import annotations
+import json
+from typing import Any
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    _OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+
+    def dumps_bytes(value: Any) -> bytes:
+        """Compact JSON as UTF-8 bytes (numpy scalars/arrays allowed)."""
+        return orjson.dumps(value, option=_OPTS)
+
+    def dumps(value: Any) -> str:
+        """Compact JSON as str, for Text columns."""
+        return orjson.dumps(value, option=_OPTS).decode()
+
+    loads = orjson.loads
+else:
+    def _default(value: Any) -> Any:
+        # numpy scalars/arrays, so ML scores need no float() walk either way
+        if hasattr(value, "tolist"):
+            return value.tolist()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    def dumps_bytes(value: Any) -> bytes:
+        return dumps(value).encode()
+
+    def dumps(value: Any) -> str:
+        return json.dumps(value, separators=(",", ":"), default=_default)
+
+    loads = json.loads
@@ -1,12 +1,41 @@
 """Structured JSON logging config."""
+import json
 import logging
 import sys
 
+try:
+    import orjson  # type: ignore
+
+    def _dumps(obj: dict) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    def _dumps(obj: dict) -> str:
+        return json.dumps(obj, separators=(",", ":"), default=str)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Timestamps are the raw epoch `record.created`,
+    which skips the strftime/localtime work of %(asctime)s on every record.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "t": record.created,
+            "lvl": record.levelname,
+            "name": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return _dumps(entry)
+
 
 def setup_logging(debug: bool = False) -> None:
     level = logging.DEBUG if debug else logging.INFO
-    fmt = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-    logging.basicConfig(stream=sys.stdout, level=level, format=fmt)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    logging.basicConfig(level=level, handlers=[handler])
     logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
 
 
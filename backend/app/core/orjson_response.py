@@ -0,0 +1,17 @@
+"""Default FastAPI response class rendering through app.core.json_utils."""
+from __future__ import annotations
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from app.core import json_utils
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered by orjson (stdlib json if it is missing), so numpy
+    scores and non-str keys serialize without custom encoders.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json_utils.dumps_bytes(content)
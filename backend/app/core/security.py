@@ -3,17 +3,21 @@ from __future__ import annotations
 import hashlib
 import hmac
 import json
-import uuid
+import os
 
 
 def generate_id(prefix: str = "") -> str:
     """Generate a URL-safe unique ID."""
-    uid = uuid.uuid4().hex
+    # Same 32 hex chars as uuid4().hex, without building a UUID object.
+    uid = os.urandom(16).hex()
     return f"{prefix}{uid}" if prefix else uid
 
 
 def hash_scores(scores: dict) -> str:
     """SHA-256 hex digest of scores dict (deterministic JSON)."""
+    # Stays on the stdlib encoder: this digest is anchored on Solana and stored
+    # as SolanaReceipt.scores_hash, so its bytes (ASCII escapes, float
+    # formatting) must not change with the JSON library installed.
     payload = json.dumps(scores, sort_keys=True, separators=(",", ":"))
     return hashlib.sha256(payload.encode()).hexdigest()
 
@@ -1,13 +1,15 @@
 """SQLAlchemy async models for the audit database."""
 from __future__ import annotations
-import json
 from datetime import datetime, timezone
 
 from sqlalchemy import (
-    Column, String, Float, Integer, Boolean, Text, DateTime, ForeignKey
+    Column, String, Float, Integer, Boolean, Text, DateTime, ForeignKey, Index,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import DeclarativeBase
 
+from app.core import json_utils
+
 
 def _now() -> datetime:
     return datetime.now(timezone.utc)
@@ -33,6 +35,12 @@ class Transfer(Base):
     created_at = Column(DateTime, default=_now)
     updated_at = Column(DateTime, default=_now, onupdate=_now)
 
+    # Match the velocity / financial-feature predicates in repo.py
+    __table_args__ = (
+        Index("ix_transfer_user_created", "user_id", "created_at"),
+        Index("ix_transfer_user_status_created", "user_id", "status", "created_at"),
+    )
+
 
 class Challenge(Base):
     __tablename__ = "challenges"
@@ -51,13 +59,19 @@ class Challenge(Base):
     used_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=_now)
 
+    # Audit listing is ordered newest first (per user or overall)
+    __table_args__ = (
+        Index("ix_challenge_user_created", "user_id", created_at.desc()),
+        Index("ix_challenge_created", created_at.desc()),
+    )
+
     @property
     def triggers(self) -> list:
-        return json.loads(self.triggers_json or "[]")
+        return json_utils.loads(self.triggers_json or "[]")
 
     @property
     def financial_features(self) -> dict:
-        return json.loads(self.financial_features_json or "{}")
+        return json_utils.loads(self.financial_features_json or "{}")
 
 
 class KnownRecipient(Base):
@@ -68,6 +82,8 @@ class KnownRecipient(Base):
     recipient_key = Column(String, nullable=False)   # "BANK:<id>" or "SOLANA:<addr>"
     created_at = Column(DateTime, default=_now)
 
+    __table_args__ = (UniqueConstraint("user_id", "recipient_key", name="uq_known_recipient"),)
+
 
 class Device(Base):
     __tablename__ = "devices"
@@ -77,6 +93,8 @@ class Device(Base):
     device_id = Column(String, nullable=False)
     created_at = Column(DateTime, default=_now)
 
+    __table_args__ = (UniqueConstraint("user_id", "device_id", name="uq_device"),)
+
 
 class SolanaReceipt(Base):
     __tablename__ = "solana_receipts"
@@ -88,3 +106,11 @@ class SolanaReceipt(Base):
     scores_hash = Column(String, nullable=False)
     tx_sig = Column(String, nullable=True)
     created_at = Column(DateTime, default=_now)
+
+
+class SeedStatus(Base):
+    """One row per seeded dataset, so startup checks are a primary-key lookup."""
+    __tablename__ = "seed_status"
+
+    key = Column(String, primary_key=True)
+    seeded_at = Column(DateTime, default=_now)
@@ -1,16 +1,20 @@
 """Data access / repository layer (async SQLAlchemy + optional Redis)."""
 from __future__ import annotations
 
-import json
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from sqlalchemy import select, func
+from sqlalchemy import (
+    Index, UniqueConstraint, and_, case, delete, func, insert, inspect, literal, or_,
+    select, update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
+from app.core import json_utils
 from app.core.config import get_settings
 from app.core.logging import get_logger
-from app.db.models import Base, Transfer, Challenge, KnownRecipient, Device, SolanaReceipt
+from app.db.models import Base, Transfer, Challenge, KnownRecipient, Device, SolanaReceipt, SeedStatus
 
 logger = get_logger(__name__)
 settings = get_settings()
@@ -18,16 +22,65 @@ settings = get_settings()
 # ---------------------------------------------------------------------------
 # Engine / Session
 # ---------------------------------------------------------------------------
-engine = create_async_engine(settings.DATABASE_URL, echo=False, future=True)
+def _pool_kwargs(url: str) -> dict:
+    # In-memory SQLite runs on a StaticPool, which takes no sizing options.
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = create_async_engine(
+    settings.DATABASE_URL, echo=False, future=True, **_pool_kwargs(settings.DATABASE_URL)
+)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
 
 async def init_db() -> None:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_ensure_unique_keys)
     logger.info("DB tables initialised")
 
 
+def _ensure_unique_keys(conn) -> None:
+    """
+    Backfill the KnownRecipient / Device unique keys on databases created
+    before they existed (create_all never alters a table). Duplicate rows are
+    dropped first, keeping the oldest, and the key is added as a unique index.
+    """
+    insp = inspect(conn)
+    for table in (KnownRecipient.__table__, Device.__table__):
+        present = [u["column_names"] for u in insp.get_unique_constraints(table.name)]
+        present += [i["column_names"] for i in insp.get_indexes(table.name) if i["unique"]]
+        for uq in table.constraints:
+            if not isinstance(uq, UniqueConstraint):
+                continue
+            cols = list(uq.columns)
+            if [c.name for c in cols] in present:
+                continue
+            keep = select(func.min(table.c.id)).group_by(*cols).scalar_subquery()
+            dropped = conn.execute(delete(table).where(table.c.id.not_in(keep))).rowcount
+            Index(uq.name, *cols, unique=True).create(conn)
+            logger.info("Added unique key %s (dropped %d duplicate rows)", uq.name, dropped)
+
+
+async def warm_pool(n: int) -> None:
+    """Open and return n pooled connections so early requests skip connect()."""
+    conns = []
+    try:
+        for _ in range(n):
+            conns.append(await engine.connect())
+    finally:
+        for conn in conns:
+            await conn.close()
+
+
 async def get_session() -> AsyncSession:      # noqa: D401
     async with AsyncSessionLocal() as session:
         yield session
@@ -55,7 +108,7 @@ async def _init_redis() -> None:
 
 async def store_challenge(challenge_id: str, data: dict, ttl: int) -> None:
     if _redis_client:
-        await _redis_client.setex(f"challenge:{challenge_id}", ttl, json.dumps(data))
+        await _redis_client.setex(f"challenge:{challenge_id}", ttl, json_utils.dumps_bytes(data))
     else:
         _challenge_store[challenge_id] = data
 
@@ -63,7 +116,7 @@ async def store_challenge(challenge_id: str, data: dict, ttl: int) -> None:
 async def get_challenge(challenge_id: str) -> Optional[dict]:
     if _redis_client:
         raw = await _redis_client.get(f"challenge:{challenge_id}")
-        return json.loads(raw) if raw else None
+        return json_utils.loads(raw) if raw else None
     return _challenge_store.get(challenge_id)
 
 
@@ -74,6 +127,55 @@ async def delete_challenge(challenge_id: str) -> None:
         _challenge_store.pop(challenge_id, None)
 
 
+# ---------------------------------------------------------------------------
+# Financial-feature cache (in-process tier in front of Redis)
+# ---------------------------------------------------------------------------
+# Features only move when a transfer executes or a payee is added (both
+# invalidate); transfers_count_24h may lag new initiations by up to the TTL.
+# With Redis configured, each worker still keeps a short-lived local copy so
+# repeat attempts from a hot user skip the Redis round-trip and decode; other
+# workers may serve a stale local copy for up to FEATURES_LOCAL_TTL_SECONDS
+# after an invalidation.
+FEATURES_CACHE_TTL_SECONDS = 60
+FEATURES_LOCAL_TTL_SECONDS = 5
+FEATURES_CACHE_MAX_ENTRIES = 10_000
+_features_store: dict[str, tuple[float, dict]] = {}
+
+
+def _store_local_features(user_id: str, features: dict) -> None:
+    ttl = FEATURES_LOCAL_TTL_SECONDS if _redis_client else FEATURES_CACHE_TTL_SECONDS
+    if user_id not in _features_store and len(_features_store) >= FEATURES_CACHE_MAX_ENTRIES:
+        _features_store.pop(next(iter(_features_store)))
+    _features_store[user_id] = (time.monotonic() + ttl, features)
+
+
+async def _get_cached_features(user_id: str) -> Optional[dict]:
+    hit = _features_store.get(user_id)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    if _redis_client:
+        raw = await _redis_client.get(f"feat:{user_id}")
+        if raw:
+            features = json_utils.loads(raw)
+            _store_local_features(user_id, features)
+            return features
+    return None
+
+
+async def _cache_features(user_id: str, features: dict) -> None:
+    if _redis_client:
+        await _redis_client.setex(
+            f"feat:{user_id}", FEATURES_CACHE_TTL_SECONDS, json_utils.dumps_bytes(features)
+        )
+    _store_local_features(user_id, features)
+
+
+async def invalidate_financial_features(user_id: str) -> None:
+    _features_store.pop(user_id, None)
+    if _redis_client:
+        await _redis_client.delete(f"feat:{user_id}")
+
+
 # ---------------------------------------------------------------------------
 # Transfer helpers
 # ---------------------------------------------------------------------------
@@ -92,14 +194,21 @@ async def get_transfer(session: AsyncSession, transfer_id: str) -> Optional[Tran
 
 async def update_transfer_status(session: AsyncSession, transfer_id: str, status: str,
                                   provider_ref: str = None, solana_pending_id: str = None) -> None:
-    t = await get_transfer(session, transfer_id)
-    if t:
-        t.status = status
-        if provider_ref is not None:
-            t.provider_ref = provider_ref
-        if solana_pending_id is not None:
-            t.solana_pending_id = solana_pending_id
-        await session.commit()
+    # Single UPDATE (updated_at via the column's onupdate) instead of
+    # SELECT + ORM mutate; only EXECUTED needs user_id back, for the cache.
+    values = {"status": status}
+    if provider_ref is not None:
+        values["provider_ref"] = provider_ref
+    if solana_pending_id is not None:
+        values["solana_pending_id"] = solana_pending_id
+    stmt = update(Transfer).where(Transfer.id == transfer_id).values(**values)
+    if status == "EXECUTED":
+        stmt = stmt.returning(Transfer.user_id)
+    result = await session.execute(stmt)
+    user_id = result.scalar_one_or_none() if status == "EXECUTED" else None
+    await session.commit()
+    if user_id is not None:
+        await invalidate_financial_features(user_id)
 
 
 # ---------------------------------------------------------------------------
@@ -121,14 +230,31 @@ async def get_challenge_record(session: AsyncSession, challenge_id: str) -> Opti
 async def update_challenge_decision(session: AsyncSession, challenge_id: str,
                                      decision: str, reasons: list, scores: dict,
                                      retry_count: int, used_at: datetime) -> None:
-    c = await get_challenge_record(session, challenge_id)
-    if c:
-        c.decision = decision
-        c.reasons_json = json.dumps(reasons)
-        c.scores_json = json.dumps(scores)
-        c.retry_count = retry_count
-        c.used_at = used_at
-        await session.commit()
+    await session.execute(
+        update(Challenge).where(Challenge.id == challenge_id).values(
+            decision=decision,
+            reasons_json=json_utils.dumps(reasons),
+            scores_json=json_utils.dumps(scores),
+            retry_count=retry_count,
+            used_at=used_at,
+        )
+    )
+    await session.commit()
+
+
+def _insert_ignore(model, *index_elements: str):
+    """
+    INSERT ... ON CONFLICT (index_elements) DO NOTHING for `model` on SQLite /
+    PostgreSQL, or None on other dialects (callers fall back to
+    select-then-insert). init_db guarantees the unique key exists.
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model).on_conflict_do_nothing(index_elements=list(index_elements))
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(model).on_conflict_do_nothing(index_elements=list(index_elements))
+    return None
 
 
 # ---------------------------------------------------------------------------
@@ -136,19 +262,27 @@ async def update_challenge_decision(session: AsyncSession, challenge_id: str,
 # ---------------------------------------------------------------------------
 async def is_known_recipient(session: AsyncSession, user_id: str, recipient_key: str) -> bool:
     result = await session.execute(
-        select(KnownRecipient).where(
+        select(KnownRecipient.id).where(
             KnownRecipient.user_id == user_id,
             KnownRecipient.recipient_key == recipient_key,
-        )
+        ).limit(1)
     )
-    return result.scalar_one_or_none() is not None
+    return result.first() is not None
 
 
 async def add_known_recipient(session: AsyncSession, user_id: str, recipient_key: str) -> None:
+    stmt = _insert_ignore(KnownRecipient, "user_id", "recipient_key")
+    if stmt is not None:
+        result = await session.execute(stmt.values(user_id=user_id, recipient_key=recipient_key))
+        await session.commit()
+        if result.rowcount:
+            await invalidate_financial_features(user_id)
+        return
     existing = await is_known_recipient(session, user_id, recipient_key)
     if not existing:
         session.add(KnownRecipient(user_id=user_id, recipient_key=recipient_key))
         await session.commit()
+        await invalidate_financial_features(user_id)
 
 
 # ---------------------------------------------------------------------------
@@ -156,12 +290,19 @@ async def add_known_recipient(session: AsyncSession, user_id: str, recipient_key
 # ---------------------------------------------------------------------------
 async def is_known_device(session: AsyncSession, user_id: str, device_id: str) -> bool:
     result = await session.execute(
-        select(Device).where(Device.user_id == user_id, Device.device_id == device_id)
+        select(Device.id).where(
+            Device.user_id == user_id, Device.device_id == device_id
+        ).limit(1)
     )
-    return result.scalar_one_or_none() is not None
+    return result.first() is not None
 
 
 async def add_device(session: AsyncSession, user_id: str, device_id: str) -> None:
+    stmt = _insert_ignore(Device, "user_id", "device_id")
+    if stmt is not None:
+        await session.execute(stmt.values(user_id=user_id, device_id=device_id))
+        await session.commit()
+        return
     if not await is_known_device(session, user_id, device_id):
         session.add(Device(user_id=user_id, device_id=device_id))
         await session.commit()
@@ -180,45 +321,62 @@ async def count_recent_initiations(session: AsyncSession, user_id: str, window_s
 
 async def get_financial_features(session: AsyncSession, user_id: str) -> dict:
     """Compute rolling financial features from transfer history."""
-    since_30d = datetime.now(timezone.utc) - timedelta(days=30)
-    since_24h = datetime.now(timezone.utc) - timedelta(hours=24)
-
-    result_30d = await session.execute(
-        select(Transfer.amount).where(
-            Transfer.user_id == user_id,
-            Transfer.created_at >= since_30d,
-            Transfer.status == "EXECUTED",
-        )
-    )
-    amounts_30d = [r[0] for r in result_30d.fetchall()]
+    _, features = await get_velocity_and_financial_features(session, user_id, None)
+    return features
+
 
-    result_24h = await session.execute(
-        select(func.count()).where(
-            Transfer.user_id == user_id,
-            Transfer.created_at >= since_24h,
+async def get_velocity_and_financial_features(
+    session: AsyncSession, user_id: str, window_seconds: Optional[int]
+) -> tuple[int, dict]:
+    """
+    Velocity count (initiations within window_seconds; 0 if None) and the
+    rolling financial features, as conditional aggregates in one query.
+    Cached features skip the aggregate; velocity is always counted fresh.
+    """
+    cached = await _get_cached_features(user_id)
+    if cached is not None:
+        velocity_count = (
+            await count_recent_initiations(session, user_id, window_seconds)
+            if window_seconds is not None else 0
         )
-    )
-    count_24h = result_24h.scalar_one() or 0
+        return velocity_count, cached
 
-    result_recipients = await session.execute(
-        select(func.count()).where(KnownRecipient.user_id == user_id)
-    )
-    known_count = result_recipients.scalar_one() or 0
+    now = datetime.now(timezone.utc)
+    since_30d = now - timedelta(days=30)
+    since_24h = now - timedelta(hours=24)
+    executed = Transfer.status == "EXECUTED"
+    executed_30d = and_(executed, Transfer.created_at >= since_30d)
 
-    result_total = await session.execute(
-        select(func.count()).where(Transfer.user_id == user_id, Transfer.status == "EXECUTED")
+    velocity = (
+        func.count(case((Transfer.created_at >= now - timedelta(seconds=window_seconds), 1)))
+        if window_seconds is not None else literal(0)
     )
-    total_tx = result_total.scalar_one() or 1  # avoid divide by zero
-
-    avg_30d = sum(amounts_30d) / len(amounts_30d) if amounts_30d else 0.0
-    max_30d = max(amounts_30d) if amounts_30d else 0.0
-
-    return {
-        "avg_amount_30d": round(avg_30d, 2),
-        "max_amount_30d": round(max_30d, 2),
-        "transfers_count_24h": count_24h,
-        "known_recipient_ratio": round(known_count / total_tx, 3),
+    known_count = (
+        select(func.count())
+        .where(KnownRecipient.user_id == user_id)
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        select(
+            velocity,
+            func.count(case((Transfer.created_at >= since_24h, 1))),
+            func.avg(case((executed_30d, Transfer.amount))),
+            func.max(case((executed_30d, Transfer.amount))),
+            func.count(case((executed, 1))),
+            known_count,
+        ).where(Transfer.user_id == user_id)
+    )
+    velocity_count, count_24h, avg_30d, max_30d, total_tx, known_count = result.one()
+    total_tx = total_tx or 1  # avoid divide by zero
+
+    features = {
+        "avg_amount_30d": round(avg_30d or 0.0, 2),
+        "max_amount_30d": round(max_30d or 0.0, 2),
+        "transfers_count_24h": count_24h or 0,
+        "known_recipient_ratio": round((known_count or 0) / total_tx, 3),
     }
+    await _cache_features(user_id, features)
+    return velocity_count or 0, features
 
 
 # ---------------------------------------------------------------------------
@@ -240,8 +398,24 @@ async def create_solana_receipt(session: AsyncSession, challenge_id: str,
 # ---------------------------------------------------------------------------
 # Audit list fetchers
 # ---------------------------------------------------------------------------
-async def list_all_challenges(session: AsyncSession) -> list[Challenge]:
-    result = await session.execute(select(Challenge).order_by(Challenge.created_at.desc()))
+async def list_all_challenges(session: AsyncSession, limit: int = 100,
+                              before: Optional[tuple[datetime, str]] = None) -> list[Challenge]:
+    """
+    Newest-first page of challenges. `before` is the (created_at, id) of the
+    last row of the previous page (keyset pagination; id breaks ties).
+    """
+    stmt = (
+        select(Challenge)
+        .order_by(Challenge.created_at.desc(), Challenge.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        created_at, challenge_id = before
+        stmt = stmt.where(or_(
+            Challenge.created_at < created_at,
+            and_(Challenge.created_at == created_at, Challenge.id < challenge_id),
+        ))
+    result = await session.execute(stmt)
     return result.scalars().all()
 
 
@@ -252,16 +426,21 @@ async def seed_demo_data() -> None:
     """Pre-populate the demo_user with realistic transaction history.
 
     This ensures the first payment from the frontend doesn't get flagged
-    simply because there's no prior history. Only seeds if no transfers
-    exist yet (i.e. first run).
+    simply because there's no prior history. Only seeds once, recorded in
+    the seed_status table.
     """
     async with AsyncSessionLocal() as session:
+        if await session.get(SeedStatus, "demo_user") is not None:
+            return  # already seeded
+
+        # Databases seeded before seed_status existed: record the marker once
         result = await session.execute(
-            select(func.count()).where(Transfer.user_id == "demo_user")
+            select(Transfer.id).where(Transfer.user_id == "demo_user").limit(1)
         )
-        count = result.scalar_one() or 0
-        if count > 0:
-            return  # already seeded
+        if result.first() is not None:
+            session.add(SeedStatus(key="demo_user"))
+            await session.commit()
+            return
 
         logger.info("Seeding demo data for demo_user")
 
@@ -285,18 +464,21 @@ async def seed_demo_data() -> None:
             {"amount": 95.00,  "days_ago": 5},
             {"amount": 500.00, "days_ago": 2},
         ]
-        for i, tx in enumerate(seed_transfers):
-            t = Transfer(
-                id=f"pay_seed_{i:03d}",
-                user_id="demo_user",
-                rail="BANK",
-                amount=tx["amount"],
-                recipient_id="demo_recipient_001",
-                note="Seed transaction",
-                status="EXECUTED",
-                created_at=now - timedelta(days=tx["days_ago"]),
-            )
-            session.add(t)
+        # One multi-row INSERT instead of a flush per ORM object
+        await session.execute(insert(Transfer), [
+            {
+                "id": f"pay_seed_{i:03d}",
+                "user_id": "demo_user",
+                "rail": "BANK",
+                "amount": tx["amount"],
+                "recipient_id": "demo_recipient_001",
+                "note": "Seed transaction",
+                "status": "EXECUTED",
+                "created_at": now - timedelta(days=tx["days_ago"]),
+            }
+            for i, tx in enumerate(seed_transfers)
+        ])
+        session.add(SeedStatus(key="demo_user"))
 
         await session.commit()
         logger.info("Demo data seeded: %d transfers, 1 device, 1 recipient", len(seed_transfers))
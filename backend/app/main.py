@@ -8,10 +8,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import get_settings
+from app.core.http import close_client
 from app.core.logging import setup_logging, get_logger
-from app.db.repo import init_db, _init_redis, seed_demo_data
+from app.core.orjson_response import ORJSONResponse
+from app.db.repo import init_db, _init_redis, seed_demo_data, warm_pool
 from app.api import payments, liveness, audit
-from app.services import presage_service
+from app.services import presage_service, solana_service
 
 settings = get_settings()
 setup_logging(settings.DEBUG)
@@ -24,6 +26,7 @@ async def lifespan(app: FastAPI):
     logger.info("Starting %s v%s", settings.APP_NAME, settings.VERSION)
     await init_db()
     await seed_demo_data()
+    await warm_pool(settings.DB_POOL_WARM)
     await _init_redis()
     logger.info(
         "Services: gemini=%s presage=%s solana=%s fiserv=%s",
@@ -34,6 +37,8 @@ async def lifespan(app: FastAPI):
     )
     yield
     logger.info("Shutting down.")
+    await close_client()
+    await solana_service.close_rpc()
 
 
 app = FastAPI(
@@ -41,6 +46,7 @@ app = FastAPI(
     version=settings.VERSION,
     description="Deepfake + Presage biometric payment gate — risk-based step-up verification.",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS — allow localhost frontends
@@ -0,0 +1,88 @@
+"""
+Optional numba kernels for ML preprocessing. Each kernel is None when
+numba is not installed and callers fall back to plain NumPy.
+"""
+import numpy as np
+
+try:
+    from numba import njit              # type: ignore
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+
+    @njit(cache=True, fastmath=True)
+    def normalize_into(img, scale, offset, out):
+        """
+        Write a uint8 (H, W, 3) BGR image into a float32 (3, H, W) RGB slot
+        as img * scale - offset, in a single pass with no temporaries.
+        """
+        h, w = img.shape[0], img.shape[1]
+        for c in range(3):
+            src = 2 - c
+            s = scale[c]
+            o = offset[c]
+            for y in range(h):
+                for x in range(w):
+                    out[c, y, x] = img[y, x, src] * s - o
+
+    @njit(cache=True)
+    def color_texture_stats(frames, patch):
+        """
+        One pass over a uint8 (N, H, W, C>=3) batch. Returns float64 (N, 5):
+        channel 0/1/2 means, then mean and std of the grayscale variance of
+        non-overlapping patch x patch tiles (grid as in FakeModel texture).
+        """
+        n, h, w, c = frames.shape
+        ny = (h - 1) // patch
+        nx = (w - 1) // patch
+        npx = patch * patch
+        out = np.zeros((n, 5))
+        tile = np.empty(npx)
+        variances = np.empty(ny * nx)
+        for i in range(n):
+            f = frames[i]
+            s0 = 0
+            s1 = 0
+            s2 = 0
+            for y in range(h):
+                for x in range(w):
+                    s0 += f[y, x, 0]
+                    s1 += f[y, x, 1]
+                    s2 += f[y, x, 2]
+            out[i, 0] = s0 / (h * w)
+            out[i, 1] = s1 / (h * w)
+            out[i, 2] = s2 / (h * w)
+
+            for ty in range(ny):
+                for tx in range(nx):
+                    k = 0
+                    tsum = 0.0
+                    for y in range(ty * patch, ty * patch + patch):
+                        for x in range(tx * patch, tx * patch + patch):
+                            g = 0
+                            for ch in range(c):
+                                g += f[y, x, ch]
+                            tile[k] = g / c
+                            tsum += tile[k]
+                            k += 1
+                    tmean = tsum / npx
+                    acc = 0.0
+                    for k in range(npx):
+                        d = tile[k] - tmean
+                        acc += d * d
+                    variances[ty * nx + tx] = acc / npx
+
+            vmean = variances.mean()
+            acc = 0.0
+            for k in range(variances.size):
+                d = variances[k] - vmean
+                acc += d * d
+            out[i, 3] = vmean
+            out[i, 4] = np.sqrt(acc / variances.size)
+        return out
+
+else:
+    normalize_into = None
+    color_texture_stats = None
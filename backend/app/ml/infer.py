@@ -1,69 +1,180 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import cv2
 import numpy as np
 from typing import Optional
 from typing import Dict, Any
 
-from app.video.decode import decode_video_bytes
+from app.video.decode import decode_video_bytes, decode_video_file
 from app.video.sampling import sample_frames
 from app.video.quality import compute_quality_score
-from app.video.liveness import compute_liveness_score
+from app.video.liveness import USE_OPENCL, compute_liveness_score, compute_pairwise_flows
 from app.video.presage_features import compute_presage_features
 from app.ml.model_loader import load_deepfake_model
-from app.ml.preprocess import preprocess_batch, resize_roi
+from app.ml.preprocess import preprocess_batch
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
-def extract_middle_frame_base64(video_bytes: bytes) -> Optional[str]:
-    import base64
+# CascadeClassifier is not safe to share across threads (detectMultiScale
+# mutates its evaluator), so each worker thread parses its own once.
+_thread_state = threading.local()
+
+# Scoring stages are independent once flows are known; cv2 and numpy release
+# the GIL, so running them on threads overlaps most of their work.
+_STAGE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="video-stage")
+
+# Haar runs on a half-resolution gray frame; bboxes are scaled back up.
+HAAR_DOWNSCALE = 2
+
+
+def _get_cascade() -> cv2.CascadeClassifier:
+    """Return this thread's Haar cascade, parsing the XML once per thread."""
+    cascade = getattr(_thread_state, "cascade", None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+        _thread_state.cascade = cascade
+    return cascade
+
+
+def to_gray_stack(frames: np.ndarray) -> np.ndarray:
+    """
+    Convert a stack of BGR frames (N, H, W, 3) to grayscale (N, H, W)
+    with a single cvtColor call over the contiguous buffer.
+    
+    Strided views (e.g. from sample_frames) are converted frame by frame
+    into the output rather than copied into a contiguous BGR stack first.
+    """
+    n, h, w = frames.shape[:3]
+    if frames.flags.c_contiguous:
+        gray = cv2.cvtColor(frames.reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY)
+        return gray.reshape(n, h, w)
+    
+    gray = np.empty((n, h, w), dtype=frames.dtype)
+    for frame, out in zip(frames, gray):
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=out)
+    return gray
+
+def downscale_stack(grays: np.ndarray, factor: int = HAAR_DOWNSCALE) -> np.ndarray:
+    """Reduce every frame of an (N, H, W) grayscale stack by `factor` with INTER_AREA."""
+    return np.stack([
+        cv2.resize(g, None, fx=1.0 / factor, fy=1.0 / factor, interpolation=cv2.INTER_AREA)
+        for g in grays
+    ])
+
+
+def extract_middle_frame_jpeg(video_bytes: bytes) -> Optional[bytes]:
     try:
         success, frames_array, _ = decode_video_bytes(video_bytes)
-        if not success or frames_array is None or len(frames_array) == 0:
-            return None
-            
-        mid_idx = len(frames_array) // 2
-        mid_frame = frames_array[mid_idx]
-        
-        # Encode to JPEG
-        success_enc, buffer = cv2.imencode('.jpg', mid_frame)
-        if not success_enc:
+        if not success:
             return None
-            
-        return base64.b64encode(buffer).decode('utf-8')
+        return middle_frame_jpeg(frames_array)
     except Exception as exc:
-        logger.error("extract_middle_frame_base64 error: %s", exc)
+        logger.error("extract_middle_frame_jpeg error: %s", exc)
+        return None
+
+
+def middle_frame_jpeg(frames: Optional[np.ndarray]) -> Optional[bytes]:
+    """JPEG bytes of the middle frame of an already decoded stack, sized for the vision model."""
+    if frames is None or len(frames) == 0:
         return None
+    return _encode_vision_jpeg(frames[len(frames) // 2])
+
+
+# Images sent to the vision model: upload size and billed image tokens scale
+# with pixels, and spoof / face-match cues survive this resolution.
+VISION_MAX_SIDE = 768
+VISION_JPEG_QUALITY = 80
+
+
+def _encode_vision_jpeg(frame: np.ndarray) -> Optional[bytes]:
+    h, w = frame.shape[:2]
+    if max(h, w) > VISION_MAX_SIDE:
+        f = VISION_MAX_SIDE / max(h, w)
+        frame = cv2.resize(frame, (round(w * f), round(h * f)), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, VISION_JPEG_QUALITY])
+    return buffer.tobytes() if ok else None
 
 
-def detect_face_haar(frame: np.ndarray, cascade: Optional[cv2.CascadeClassifier] = None) -> Optional[tuple]:
+def shrink_jpeg_for_vision(jpeg: bytes) -> bytes:
+    """
+    Re-encode an arbitrary JPEG (e.g. a stored profile photo) at most
+    VISION_MAX_SIDE px on the long edge. Images already within bounds, or
+    that fail to decode, are returned unchanged.
+    """
+    img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    if img is None or max(img.shape[:2]) <= VISION_MAX_SIDE:
+        return jpeg
+    return _encode_vision_jpeg(img) or jpeg
+
+
+def detect_face_haar(
+    frame: np.ndarray,
+    cascade: Optional[cv2.CascadeClassifier] = None,
+    gray: Optional[np.ndarray] = None,
+    small: Optional[np.ndarray] = None,
+) -> Optional[tuple]:
     """
     Detect face using Haar cascade.
-    
+
+    Detection runs on a half-resolution copy of the grayscale frame; pass a
+    precomputed `gray` to skip the BGR→GRAY conversion, or the already
+    reduced `small` frame to skip the resize as well.
+
     Returns:
-        tuple: (x, y, w, h) or None if no face detected
+        tuple: (x, y, w, h) in full-resolution coordinates, or None if no face detected
     """
     if cascade is None:
-        cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        cascade = _get_cascade()
+
+    if small is None:
+        if gray is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(
+            gray, None,
+            fx=1.0 / HAAR_DOWNSCALE, fy=1.0 / HAAR_DOWNSCALE,
+            interpolation=cv2.INTER_AREA
         )
-    
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    gray = cv2.equalizeHist(gray)
-    
+    if USE_OPENCL:
+        small = cv2.UMat(np.ascontiguousarray(small))
+    small = cv2.equalizeHist(small)
+
     faces = cascade.detectMultiScale(
-        gray,
+        small,
         scaleFactor=1.1,
         minNeighbors=5,
-        minSize=(30, 30)
+        minSize=(15, 15)
     )
-    
+
     if len(faces) > 0:
-        x, y, w, h = faces[0]
-        return (int(x), int(y), int(w), int(h))
-    
+        x, y, w, h = (int(v) * HAAR_DOWNSCALE for v in faces[0])
+        return (x, y, w, h)
+
     return None
 
 
+def detect_faces_batch(
+    frames: np.ndarray,
+    grays: Optional[np.ndarray] = None,
+    smalls: Optional[np.ndarray] = None,
+) -> list[Optional[tuple]]:
+    """
+    Run Haar detection over every frame, converting to grayscale in one pass.
+
+    `smalls` is the grayscale stack already reduced by HAAR_DOWNSCALE.
+    """
+    if smalls is None:
+        if grays is None:
+            grays = to_gray_stack(frames)
+        smalls = downscale_stack(grays)
+    cascade = _get_cascade()
+    return [detect_face_haar(frames[i], cascade, small=smalls[i]) for i in range(len(smalls))]
+
+
 def extract_face_roi(frame: np.ndarray, bbox: tuple) -> Optional[np.ndarray]:
     """Extract face ROI from frame using bounding box."""
     if bbox is None:
@@ -86,6 +197,42 @@ def extract_face_roi(frame: np.ndarray, bbox: tuple) -> Optional[np.ndarray]:
     return roi
 
 
+def extract_face_rois(
+    frames: np.ndarray,
+    face_bboxes: list[Optional[tuple]],
+) -> list[Optional[np.ndarray]]:
+    """
+    Extract face ROIs for a stack of same-sized frames.
+    
+    Bounding boxes are clamped to the frame in one vectorised pass; the
+    semantics match extract_face_roi applied frame by frame.
+    """
+    if len(face_bboxes) == 0:
+        return []
+    
+    h_frame, w_frame = frames.shape[1:3]
+    boxes = np.array([b if b is not None else (0, 0, 0, 0) for b in face_bboxes], dtype=np.int64)
+    
+    x = np.maximum(boxes[:, 0], 0)
+    y = np.maximum(boxes[:, 1], 0)
+    w = np.minimum(boxes[:, 2], w_frame - x)
+    h = np.minimum(boxes[:, 3], h_frame - y)
+    valid = (w > 0) & (h > 0) & np.array([b is not None for b in face_bboxes])
+    
+    clamped = np.stack([x, y, w, h], axis=1).tolist()
+    
+    return [
+        frames[i, y0:y0 + h0, x0:x0 + w0] if ok else None
+        for i, ((x0, y0, w0, h0), ok) in enumerate(zip(clamped, valid.tolist()))
+    ]
+
+
+@lru_cache(maxsize=4)
+def _blank_probability(model) -> float:
+    """Fake probability the model assigns to a frame with no face ROI."""
+    return float(model.predict_batch(np.zeros((1, 3, 224, 224), dtype=np.float32))[0])
+
+
 def compute_temporal_inconsistency(rois: list, fake_probs: list) -> float:
     """
     Compute temporal inconsistency score.
@@ -105,6 +252,9 @@ def compute_temporal_inconsistency(rois: list, fake_probs: list) -> float:
 def analyze_video_bytes(video_bytes: bytes, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Main entry point for video analysis.
+
+    Synchronous and CPU-bound (decode, cv2, model inference); async callers
+    run it, like analyze_decoded_video, through asyncio.to_thread.
     
     Args:
         video_bytes: Raw video file bytes
@@ -113,6 +263,22 @@ def analyze_video_bytes(video_bytes: bytes, config: Optional[Dict[str, Any]] = N
     Returns:
         dict with keys: deepfake_mean, deepfake_var, liveness, quality, presage, signals, presage_raw
     """
+    return analyze_decoded_video(decode_video_bytes(video_bytes), config)
+
+
+def analyze_video_file(path: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Same as analyze_video_bytes for a video already spooled to disk."""
+    return analyze_decoded_video(decode_video_file(path), config)
+
+
+def analyze_decoded_video(
+    decoded: tuple[bool, Optional[np.ndarray], list[str]],
+    config: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Run the analysis on the (success, frames, signals) result of a decode,
+    so one decode can be shared with other consumers of the same video.
+    """
     if config is None:
         config = {}
     
@@ -122,7 +288,7 @@ def analyze_video_bytes(video_bytes: bytes, config: Optional[Dict[str, Any]] = N
     signals = []
     all_signals = []
     
-    success, frames, decode_signals = decode_video_bytes(video_bytes)
+    success, frames, decode_signals = decoded
     if not success:
         return {
             "deepfake_mean": 0.0,
@@ -162,25 +328,13 @@ def analyze_video_bytes(video_bytes: bytes, config: Optional[Dict[str, Any]] = N
             }
         }
     
-    cascade = cv2.CascadeClassifier(
-        cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-    )
-    
-    face_bboxes = []
-    rois = []
-    
-    for frame in sampled_frames:
-        bbox = detect_face_haar(frame, cascade)
-        face_bboxes.append(bbox)
-        
-        if bbox is not None:
-            roi = extract_face_roi(frame, bbox)
-            rois.append(roi)
-        else:
-            rois.append(None)
-    
-    quality, quality_signals = compute_quality_score(rois)
-    all_signals.extend(quality_signals)
+    # One gray stack and one half-resolution copy drive Haar and optical flow;
+    # quality, micro-motion and the deepfake tensors still read full-res pixels.
+    grays = to_gray_stack(sampled_frames)
+    grays_small = downscale_stack(grays)
+    face_bboxes = detect_faces_batch(sampled_frames, smalls=grays_small)
+    rois = extract_face_rois(sampled_frames, face_bboxes)
+    gray_rois = extract_face_rois(grays, face_bboxes)
     
     if "decode_failed" in all_signals:
         return {
@@ -198,31 +352,42 @@ def analyze_video_bytes(video_bytes: bytes, config: Optional[Dict[str, Any]] = N
             }
         }
     
-    liveness, liveness_signals = compute_liveness_score(
-        list(sampled_frames), face_bboxes
-    )
-    all_signals.extend(liveness_signals)
+    # Gray crops come from the same cvtColor, so quality skips its own per-ROI
+    # conversions (blur and brightness each converted every crop)
+    quality_future = _STAGE_POOL.submit(compute_quality_score, gray_rois)
+    
+    flows = compute_pairwise_flows(grays_small, face_bboxes, downscale=HAAR_DOWNSCALE)
     
-    presage, presage_raw, presage_signals = compute_presage_features(
-        list(sampled_frames), rois, face_bboxes
+    liveness_future = _STAGE_POOL.submit(
+        compute_liveness_score, list(sampled_frames), face_bboxes, flows=flows
+    )
+    presage_future = _STAGE_POOL.submit(
+        compute_presage_features, sampled_frames, rois, face_bboxes,
+        flows=flows, gray_rois=gray_rois
     )
-    all_signals.extend(presage_signals)
     
     deepfake_model, is_fake = load_deepfake_model()
     if is_fake:
         signals.append("using_fake_model")
     
-    preprocessed = []
-    for roi in rois:
-        if roi is not None and roi.size > 0:
-            resized = resize_roi(roi, (224, 224))
-            from app.ml.preprocess import normalize_to_tensor
-            tensor = normalize_to_tensor(resized)
-            preprocessed.append(tensor)
-        else:
-            preprocessed.append(np.zeros((3, 224, 224), dtype=np.float32))
+    # Only frames with a face go through the model; the rest get the score
+    # the model gives an empty (all-zero) tensor, which is what they used to
+    # be scored as.
+    valid_idx = [i for i, roi in enumerate(rois) if roi is not None and roi.size > 0]
+    fake_probs = [_blank_probability(deepfake_model)] * len(rois)
+    if valid_idx:
+        preprocessed = preprocess_batch([rois[i] for i in valid_idx], (224, 224))
+        for i, p in zip(valid_idx, deepfake_model.predict_batch(preprocessed)):
+            fake_probs[i] = p
+    
+    quality, quality_signals = quality_future.result()
+    all_signals.extend(quality_signals)
     
-    fake_probs = deepfake_model.predict_batch(preprocessed)
+    liveness, liveness_signals = liveness_future.result()
+    all_signals.extend(liveness_signals)
+    
+    presage, presage_raw, presage_signals = presage_future.result()
+    all_signals.extend(presage_signals)
     
     temporal_inconsistency = compute_temporal_inconsistency(rois, fake_probs)
     if temporal_inconsistency > 0.5:
@@ -236,7 +401,7 @@ def analyze_video_bytes(video_bytes: bytes, config: Optional[Dict[str, Any]] = N
     deepfake_mean = max(0.0, min(1.0, deepfake_mean))
     deepfake_var = max(0.0, min(1.0, deepfake_var))
     
-    unique_signals = list(set(all_signals))
+    unique_signals = list(dict.fromkeys(all_signals))
     
     return {
         "deepfake_mean": deepfake_mean,
@@ -245,10 +410,6 @@ def analyze_video_bytes(video_bytes: bytes, config: Optional[Dict[str, Any]] = N
         "quality": float(quality),
         "presage": float(presage),
         "signals": unique_signals,
-        "presage_raw": {
-            "micro_motion": float(presage_raw.get("micro_motion", 0.0)),
-            "smoothness": float(presage_raw.get("smoothness", 0.0)),
-            "periodicity_proxy": float(presage_raw.get("periodicity_proxy", 0.0)),
-            "face_presence_ratio": float(presage_raw.get("face_presence_ratio", 0.0))
-        }
+        # compute_presage_features already returns plain floats
+        "presage_raw": presage_raw,
     }
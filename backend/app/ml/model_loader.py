@@ -1,6 +1,11 @@
 import os
+from functools import lru_cache
+
+import cv2
 import numpy as np
-from typing import Optional
+from typing import Optional, Union
+
+from app.ml import _kernels
 
 
 class FakeModel:
@@ -21,121 +26,152 @@ class FakeModel:
 
         Calibrated so real faces produce scores in [0.05, 0.15].
         """
-        if frame_tensor is None or frame_tensor.size == 0:
-            return 0.1  # unknown → assume real
-
-        features = []
-
-        edge_score = self._detect_edge_artifacts(frame_tensor)
-        features.append(edge_score)
-
-        color_score = self._detect_color_abnormality(frame_tensor)
-        features.append(color_score)
+        return self.predict_batch([frame_tensor])[0]
 
-        texture_score = self._detect_texture_anomaly(frame_tensor)
-        features.append(texture_score)
-
-        fake_prob = np.mean(features) if features else 0.1
-
-        return float(max(0.0, min(1.0, fake_prob)))
-
-    def _to_hwc_uint8(self, frame: np.ndarray) -> np.ndarray:
-        """Normalise tensor to HWC uint8 format."""
+    def _to_hwc(self, frame: np.ndarray) -> np.ndarray:
+        """Return an HWC view of a CHW / NCHW / HWC tensor (no copy)."""
         if len(frame.shape) == 4:
             frame = frame[0]
         if len(frame.shape) == 3 and frame.shape[0] == 3:
             frame = np.transpose(frame, (1, 2, 0))
-        if frame.max() <= 1.0:
-            frame = (frame * 255).astype(np.uint8)
-        else:
-            frame = frame.astype(np.uint8)
         return frame
 
-    def _detect_edge_artifacts(self, frame: np.ndarray) -> float:
+    def _to_hwc_float(self, frames: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Stack tensors into one (N, H, W, C) array in their original dtype.
+
+        Returns:
+            tuple: (frames, scale) where scale maps each frame to a 0-255 range
+        """
+        arr = np.stack([self._to_hwc(f) for f in frames])
+        peak = arr.reshape(len(arr), -1).max(axis=1)
+        # Tensors already in [0, 1] are rescaled to [0, 255] per frame
+        scale = np.where(peak <= 1.0, 255, 1).astype(arr.dtype)
+        return arr, scale
+
+    def _to_hwc_uint8(self, frames: np.ndarray, scale: np.ndarray) -> np.ndarray:
+        """
+        Cast a stacked (N, H, W, C) batch to uint8 using per-frame scale.
+        Scales `frames` in place; callers read anything they need from the
+        unscaled batch first.
+        """
+        frames *= scale.reshape((-1,) + (1,) * (frames.ndim - 1))
+        return frames.astype(np.uint8)
+
+    def _gray(self, frames: np.ndarray) -> np.ndarray:
+        """(N, H, W) float32 grayscale from an (N, H, W, C) or (N, H, W) batch."""
+        # float32 halves the bytes every detector streams vs. numpy's float64 default
+        if frames.ndim == 4:
+            return np.mean(frames, axis=3, dtype=np.float32)
+        return frames.astype(np.float32)
+
+    def _detect_edge_artifacts(self, gray: np.ndarray, scale: np.ndarray) -> np.ndarray:
         """
         Detect edge artifacts typical of fake videos.
         Real webcam faces have edge_strength ~10-30. Deepfakes often have
         sharper boundary artefacts pushing strength > 40.
+
+        Works on the grayscale of the float tensor directly; `scale` brings
+        the mean gradient back to 0-255 units so the thresholds below still apply.
         """
-        frame = self._to_hwc_uint8(frame)
-        gray = np.mean(frame, axis=2) if len(frame.shape) == 3 else frame.astype(float)
+        _, h, w = gray.shape
 
-        sobel_x = np.abs(np.diff(gray, axis=1))
-        sobel_y = np.abs(np.diff(gray, axis=0))
-        edge_strength = np.mean(sobel_x) + np.mean(sobel_y)
+        # cv2.norm(a, b, L1) sums |a - b| in one SIMD pass without building
+        # the difference image that np.abs(np.diff(...)) would allocate.
+        sobel_x = np.array([cv2.norm(g[:, 1:], g[:, :-1], cv2.NORM_L1) for g in gray])
+        sobel_y = np.array([cv2.norm(g[1:, :], g[:-1, :], cv2.NORM_L1) for g in gray])
+        edge_strength = (sobel_x / (h * (w - 1)) + sobel_y / ((h - 1) * w)) * scale
 
         # Typical real face: edge_strength 10-30 → score 0.0-0.1
         # Deepfake artefacts: edge_strength 40+ → score 0.3+
-        if edge_strength < 35:
-            return edge_strength / 350.0  # 0.0 – 0.10
-        return min((edge_strength - 35) / 30.0 * 0.5 + 0.1, 1.0)
+        return np.where(
+            edge_strength < 35,
+            edge_strength / 350.0,  # 0.0 – 0.10
+            np.minimum((edge_strength - 35) / 30.0 * 0.5 + 0.1, 1.0),
+        )
 
-    def _detect_color_abnormality(self, frame: np.ndarray) -> float:
+    def _detect_color_abnormality(self, frames: np.ndarray) -> np.ndarray:
         """
         Detect abnormal colour distribution.
         Real skin tones naturally have R > G > B, so R/G ≈ 1.05-1.25
         and G/B ≈ 1.0-1.15. Only flag if ratios are way outside that.
         """
-        frame = self._to_hwc_uint8(frame)
-        if len(frame.shape) < 3 or frame.shape[2] < 3:
-            return 0.05
+        if frames.ndim < 4 or frames.shape[3] < 3:
+            return np.full(len(frames), 0.05)
+
+        channel_means = frames[..., :3].mean(axis=(1, 2), dtype=np.float64)  # (N, 3)
+        return self._color_score(channel_means)
 
-        r = np.mean(frame[..., 0].astype(float))
-        g = np.mean(frame[..., 1].astype(float))
-        b = np.mean(frame[..., 2].astype(float))
+    def _color_score(self, channel_means: np.ndarray) -> np.ndarray:
+        """Colour abnormality score from (N, 3) per-frame channel means."""
+        r, g, b = channel_means[:, 0], channel_means[:, 1], channel_means[:, 2]
 
         rg_ratio = r / (g + 1e-6)
         gb_ratio = g / (b + 1e-6)
 
         # Natural skin: R/G in [0.9, 1.4], G/B in [0.85, 1.3]
-        rg_deviation = max(0, abs(rg_ratio - 1.15) - 0.25)
-        gb_deviation = max(0, abs(gb_ratio - 1.05) - 0.20)
+        rg_deviation = np.maximum(0, np.abs(rg_ratio - 1.15) - 0.25)
+        gb_deviation = np.maximum(0, np.abs(gb_ratio - 1.05) - 0.20)
 
-        color_score = min((rg_deviation + gb_deviation) * 0.5, 1.0)
-        return color_score
+        return np.minimum((rg_deviation + gb_deviation) * 0.5, 1.0)
 
-    def _detect_texture_anomaly(self, frame: np.ndarray) -> float:
+    def _detect_texture_anomaly(self, gray: np.ndarray) -> np.ndarray:
         """
         Simple LBP-like texture consistency check.
         Real faces have natural texture variation; GAN-generated faces
         sometimes have unnaturally smooth or repetitive micro-textures.
         """
-        frame = self._to_hwc_uint8(frame)
-        gray = np.mean(frame, axis=2) if len(frame.shape) == 3 else frame.astype(float)
+        n = len(gray)
 
         # Local variance in small patches
-        h, w = gray.shape[:2]
+        h, w = gray.shape[1:3]
         if h < 16 or w < 16:
-            return 0.05
+            return np.full(n, 0.05)
 
+        # Non-overlapping patches on the same grid as
+        # range(0, h - patch_size, patch_size), i.e. the last full row/column
+        # of patches is not scored.
         patch_size = 8
-        variances = []
-        for y in range(0, h - patch_size, patch_size):
-            for x in range(0, w - patch_size, patch_size):
-                patch = gray[y:y + patch_size, x:x + patch_size]
-                variances.append(np.var(patch))
-
-        if not variances:
-            return 0.05
+        ny = (h - 1) // patch_size
+        nx = (w - 1) // patch_size
+        patches = gray[:, :ny * patch_size, :nx * patch_size].reshape(
+            n, ny, patch_size, nx, patch_size
+        )
+        variances = patches.var(axis=(2, 4)).reshape(n, -1)
 
-        mean_var = np.mean(variances)
-        std_var = np.std(variances)
+        return self._texture_score(variances.mean(axis=1), variances.std(axis=1))
 
+    def _texture_score(self, mean_var: np.ndarray, std_var: np.ndarray) -> np.ndarray:
+        """Texture anomaly score from per-frame patch-variance mean / std."""
         # Real faces: varied texture (mean_var > 50, std_var > 30)
         # Over-smooth (GAN): mean_var < 20
         # Over-sharp (spliced): mean_var > 200
-        if 20 < mean_var < 200 and std_var > 10:
-            return 0.05  # normal texture
-        elif mean_var < 20:
-            return 0.3  # suspiciously smooth
-        elif mean_var > 200:
-            return 0.25  # suspiciously sharp
-        else:
-            return 0.1
+        return np.select(
+            [
+                (20 < mean_var) & (mean_var < 200) & (std_var > 10),  # normal texture
+                mean_var < 20,    # suspiciously smooth
+                mean_var > 200,   # suspiciously sharp
+            ],
+            [0.05, 0.3, 0.25],
+            default=0.1,
+        )
+
+    def predict_batch(self, frame_tensors: Union[list[np.ndarray], np.ndarray]) -> list[float]:
+        """
+        Predict fake probability for a batch of frames in one vectorised pass.
 
-    def predict_batch(self, frame_tensors: list[np.ndarray]) -> list[float]:
-        """Predict fake probability for a batch of frames."""
-        probs = [self.predict(ft) for ft in frame_tensors]
+        Accepts a list of (C, H, W) tensors or an already stacked (N, C, H, W) array.
+        Tensors may differ in size; each shape is scored as its own stack.
+        """
+        probs = np.full(len(frame_tensors), 0.1)  # unknown → assume real
+        groups: dict[tuple, list[int]] = {}
+        for i, ft in enumerate(frame_tensors):
+            if ft is not None and ft.size > 0:
+                key = (self._to_hwc(ft).shape, ft.dtype)
+                groups.setdefault(key, []).append(i)
+
+        for idx in groups.values():
+            probs[idx] = self._score_stack([frame_tensors[i] for i in idx])
 
         # Inter-frame consistency: real faces have consistent low scores.
         # If variance across frames is very high, that's suspicious.
@@ -143,9 +179,33 @@ class FakeModel:
             frame_var = np.var(probs)
             if frame_var > 0.05:
                 # High variance across frames → bump all scores slightly
-                probs = [min(p + 0.1, 1.0) for p in probs]
-
-        return probs
+                probs = np.minimum(probs + 0.1, 1.0)
+
+        return probs.tolist()
+
+    def _score_stack(self, tensors: list[np.ndarray]) -> np.ndarray:
+        """Fake probabilities for same-shape tensors in one vectorised pass."""
+        # One HWC stack per shape; each grayscale is computed once and
+        # shared with the detector that needs it.
+        frames, scale = self._to_hwc_float(tensors)
+        gray = self._gray(frames)
+        frames_u8 = self._to_hwc_uint8(frames, scale)
+        _, h, w = gray.shape
+        if (_kernels.color_texture_stats is not None and frames_u8.ndim == 4
+                and frames_u8.shape[3] >= 3 and h >= 16 and w >= 16):
+            # Colour and texture statistics in one fused pass over the uint8 batch
+            stats = _kernels.color_texture_stats(np.ascontiguousarray(frames_u8), 8)
+            color = self._color_score(stats[:, :3])
+            texture = self._texture_score(stats[:, 3], stats[:, 4])
+        else:
+            color = self._detect_color_abnormality(frames_u8)
+            texture = self._detect_texture_anomaly(self._gray(frames_u8))
+        features = np.stack([
+            self._detect_edge_artifacts(gray, scale),
+            color,
+            texture,
+        ])
+        return np.clip(features.mean(axis=0), 0.0, 1.0)
 
 
 class RealDeepfakeModel:
@@ -154,6 +214,7 @@ class RealDeepfakeModel:
     def __init__(self, weights_path: Optional[str] = None):
         self.weights_path = weights_path
         self.model = None
+        self.device = None
         self._load_model()
 
     def _load_model(self):
@@ -161,6 +222,7 @@ class RealDeepfakeModel:
         if self.weights_path and os.path.exists(self.weights_path):
             try:
                 import torch
+                self.device = torch.device("cpu")
                 self.model = torch.nn.Sequential(
                     torch.nn.Conv2d(3, 64, 3, padding=1),
                     torch.nn.ReLU(),
@@ -173,9 +235,30 @@ class RealDeepfakeModel:
                 )
                 self.model.load_state_dict(torch.load(self.weights_path))
                 self.model.eval()
+                self.model = self.model.to(memory_format=torch.channels_last)
+
+                if torch.cuda.is_available():
+                    self.device = torch.device("cuda")
+                    self.model = self.model.to(self.device).half()
+                else:
+                    torch.set_num_threads(os.cpu_count() or 1)
+                    self.model = torch.quantization.quantize_dynamic(
+                        self.model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
             except Exception:
                 self.model = None
 
+    def _to_input(self, batch):
+        """Move an (N, C, H, W) tensor to the model's device, dtype and layout."""
+        import torch
+
+        if self.device.type == "cuda":
+            # non_blocking only overlaps the H2D copy when the source is pinned
+            batch = batch.pin_memory().to(self.device, non_blocking=True).half()
+        else:
+            batch = batch.to(self.device)
+        return batch.contiguous(memory_format=torch.channels_last)
+
     def predict(self, frame_tensor: np.ndarray) -> float:
         """Run inference on a single frame."""
         if self.model is None:
@@ -186,36 +269,42 @@ class RealDeepfakeModel:
         tensor = torch.from_numpy(frame_tensor).unsqueeze(0)
 
         with torch.inference_mode():
-            prob = self.model(tensor).item()
+            prob = self.model(self._to_input(tensor)).float().item()
 
         return prob
 
-    def predict_batch(self, frame_tensors: list[np.ndarray]) -> list[float]:
-        """Run inference on a batch of frames."""
+    def predict_batch(self, frame_tensors: Union[list[np.ndarray], np.ndarray]) -> list[float]:
+        """Run inference on a list of (C, H, W) tensors or a stacked (N, C, H, W) array."""
         if self.model is None:
             return [0.5] * len(frame_tensors)
 
         import torch
 
-        batch = torch.from_numpy(np.stack(frame_tensors))
+        if isinstance(frame_tensors, np.ndarray):
+            # Zero-copy when the batch is already contiguous float32
+            batch = torch.from_numpy(np.ascontiguousarray(frame_tensors, dtype=np.float32))
+        else:
+            batch = torch.from_numpy(np.stack(frame_tensors))
 
         with torch.inference_mode():
-            probs = self.model(batch).squeeze().tolist()
-
-        if isinstance(probs, float):
-            return [probs]
-        return probs
+            # (N, 1) -> N floats in one device-to-host copy
+            return self.model(self._to_input(batch)).float().flatten().tolist()
 
 
 def load_deepfake_model() -> tuple[Optional[object], bool]:
     """
     Load deepfake detection model.
 
+    The model is built once per weights path and reused across requests.
+
     Returns:
         tuple: (model, is_fake_model)
     """
-    weights_path = os.environ.get("DEEPFAKE_WEIGHTS")
+    return _load_deepfake_model(os.environ.get("DEEPFAKE_WEIGHTS"))
+
 
+@lru_cache(maxsize=1)
+def _load_deepfake_model(weights_path: Optional[str]) -> tuple[Optional[object], bool]:
     if weights_path and os.path.exists(weights_path):
         try:
             model = RealDeepfakeModel(weights_path)
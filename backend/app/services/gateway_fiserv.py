@@ -3,8 +3,11 @@ Fiserv Payments gateway (optional real implementation).
 Falls back to simulator if FISERV_* env vars are absent.
 """
 from __future__ import annotations
+import base64
+from functools import lru_cache
 
 from app.core.config import get_settings
+from app.core.http import get_client
 from app.core.logging import get_logger
 import app.services.gateway_bank_simulator as _sim
 
@@ -12,6 +15,7 @@ logger = get_logger(__name__)
 settings = get_settings()
 
 _USE_SIM = not settings.fiserv_configured
+_TIMEOUT = 10.0
 
 
 async def initiate_transfer(user_id: str, amount: float, recipient_id: str, note: str) -> str:
@@ -43,7 +47,6 @@ async def cancel(payment_id: str) -> None:
 # ---------------------------------------------------------------------------
 async def _real_initiate(user_id: str, amount: float, recipient_id: str, note: str) -> str:
     """POST /payments to Fiserv API."""
-    import httpx
     headers = _fiserv_headers()
     payload = {
         "merchantId": settings.FISERV_MERCHANT_ID,
@@ -51,11 +54,12 @@ async def _real_initiate(user_id: str, amount: float, recipient_id: str, note: s
         "transactionDetails": {"captureFlag": "false", "description": note},
         "paymentSource": {"sourceType": "PaymentCard"},
     }
-    async with httpx.AsyncClient(base_url=settings.FISERV_BASE_URL, timeout=10) as client:
-        resp = await client.post("/ch/payments/v1/charges", json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("ipgTransactionId", "UNKNOWN")
+    resp = await get_client().post(
+        _url("/ch/payments/v1/charges"), json=payload, headers=headers, timeout=_TIMEOUT
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("ipgTransactionId", "UNKNOWN")
 
 
 async def _real_hold(payment_id: str) -> None:
@@ -63,26 +67,30 @@ async def _real_hold(payment_id: str) -> None:
 
 
 async def _real_execute(payment_id: str) -> tuple[str, str | None]:
-    import httpx
     headers = _fiserv_headers()
-    async with httpx.AsyncClient(base_url=settings.FISERV_BASE_URL, timeout=10) as client:
-        resp = await client.post(
-            f"/ch/payments/v1/charges/{payment_id}/capture", headers=headers
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return "EXECUTED", data.get("ipgTransactionId")
+    resp = await get_client().post(
+        _url(f"/ch/payments/v1/charges/{payment_id}/capture"), headers=headers, timeout=_TIMEOUT
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    return "EXECUTED", data.get("ipgTransactionId")
 
 
 async def _real_cancel(payment_id: str) -> None:
-    import httpx
     headers = _fiserv_headers()
-    async with httpx.AsyncClient(base_url=settings.FISERV_BASE_URL, timeout=10) as client:
-        await client.post(f"/ch/payments/v1/charges/{payment_id}/void", headers=headers)
+    await get_client().post(
+        _url(f"/ch/payments/v1/charges/{payment_id}/void"), headers=headers, timeout=_TIMEOUT
+    )
 
 
+def _url(path: str) -> str:
+    # The shared client has no base_url; it is used by every outbound service.
+    return settings.FISERV_BASE_URL.rstrip("/") + path
+
+
+@lru_cache(maxsize=1)
 def _fiserv_headers() -> dict:
-    import base64
+    """Basic-auth headers, encoded once; credentials are fixed for the process."""
     credentials = base64.b64encode(
         f"{settings.FISERV_CLIENT_ID}:{settings.FISERV_CLIENT_SECRET}".encode()
     ).decode()
@@ -4,14 +4,28 @@ Gemini risk service.
 - If missing: applies deterministic policy rules.
 """
 from __future__ import annotations
+import asyncio
+import time
 from datetime import datetime, timezone
+from functools import lru_cache
+from ipaddress import ip_address
 
+from app.core import json_utils
 from app.core.config import get_settings
 from app.core.logging import get_logger
+from app.services.openrouter_service import evaluate_risk_fallback
+
+try:
+    import google.generativeai as genai      # type: ignore
+except ImportError:
+    genai = None
 
 logger = get_logger(__name__)
 settings = get_settings()
 
+# Upper bound on one Gemini call; slower answers fall through to the fallbacks
+GEMINI_TIMEOUT_SECONDS = 8.0
+
 SYSTEM_PROMPT = """
 You are a security decision engine.
 
@@ -106,6 +120,19 @@ You must return STRICT JSON only. Do NOT include markdown. Do NOT include commen
 """.strip()
 
 
+@lru_cache(maxsize=4)
+def _get_model(system_instruction: str):
+    """GenerativeModel per system prompt, configured and built once per process."""
+    if genai is None:
+        raise RuntimeError("google-generativeai is not installed")
+    genai.configure(api_key=settings.GEMINI_API_KEY)
+    return genai.GenerativeModel(
+        model_name=settings.GEMINI_MODEL,
+        system_instruction=system_instruction,
+        generation_config={"response_mime_type": "application/json"},
+    )
+
+
 async def evaluate_risk(
     *,
     scores: dict,                  # deepfake_mean, deepfake_var, liveness, quality, presage
@@ -152,34 +179,77 @@ async def evaluate_transaction_risk(
     if not settings.gemini_configured:
         return {"risk_percentage": 0, "risk_level": "LOW", "explanation": "Gemini not configured"}
 
-    import json
-    import google.generativeai as genai      # type: ignore
+    base = _amount_base_risk(amount)
+    if not settings.GEMINI_TRANSACTION_EXPLANATIONS:
+        return _local_transaction_risk(base, amount, new_payee)
 
+    # The prompt's score only depends on the amount band and prior_interaction,
+    # so one LLM score per (band, new_payee) is reused. Its explanation quotes
+    # the amount, so cache hits get one built for this transaction instead.
+    key = (base, new_payee)
+    if key in _tx_risk_cache:
+        pct, level = _tx_risk_cache[key]
+        return {"risk_percentage": pct, "risk_level": level,
+                "explanation": _risk_explanation(base, amount, new_payee)}
+    result = await _gemini_transaction_risk(user_id, recipient_id, amount, transaction_id, new_payee)
+    if result["explanation"] != "Eval failed":
+        _tx_risk_cache[key] = (result["risk_percentage"], result["risk_level"])
+    return result
+
+
+_tx_risk_cache: dict[tuple[int, bool], tuple[int, str]] = {}   # (base risk, new_payee) -> (pct, level)
+
+# TRANSACTION_SYSTEM_PROMPT's "high-entropy transaction_id" rule. Server ids
+# come from generate_id (os.urandom hex), so it applies to every transaction.
+_TX_ID_ENTROPY_RISK = 10
+
+
+# TRANSACTION_SYSTEM_PROMPT's heuristics, evaluated locally.
+def _amount_base_risk(amount: float) -> int:
+    if amount < 100:
+        return 10
+    if amount <= 1000:
+        return 30
+    return 60
+
+
+def _local_transaction_risk(base: int, amount: float, new_payee: bool) -> dict:
+    pct = min(base + (15 if new_payee else 0) + _TX_ID_ENTROPY_RISK, 100)
+    level = "LOW" if pct < 30 else "MEDIUM" if pct < 70 else "HIGH"
+    return {"risk_percentage": pct, "risk_level": level,
+            "explanation": _risk_explanation(base, amount, new_payee)}
+
+
+def _risk_explanation(base: int, amount: float, new_payee: bool) -> str:
+    return (
+        f"Amount ${amount:.2f} scores base risk {base}"
+        + (", plus 15 for a payee with no prior interaction" if new_payee else "")
+        + f", plus {_TX_ID_ENTROPY_RISK} for a random transaction id."
+    )
+
+
+async def _gemini_transaction_risk(
+    user_id: str, recipient_id: str, amount: float, transaction_id: str, new_payee: bool
+) -> dict:
     try:
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel(
-            model_name=settings.GEMINI_MODEL,
-            system_instruction=TRANSACTION_SYSTEM_PROMPT,
-            generation_config={"response_mime_type": "application/json"},
-        )
+        model = _get_model(TRANSACTION_SYSTEM_PROMPT)
 
-        user_msg = json.dumps({
+        user_msg = json_utils.dumps({
             "transaction_id": transaction_id,
             "user_id": user_id,
             "recipient_id": recipient_id,
             "amount": amount,
             "prior_interaction": not new_payee
-        }, indent=2)
+        })
 
-        resp = model.generate_content(user_msg)
+        resp = await asyncio.wait_for(
+            model.generate_content_async(user_msg), timeout=GEMINI_TIMEOUT_SECONDS
+        )
         text = resp.text.strip()
         
-        logger.info(f"--- GEMINI TRANSACTION SCORING LOGS ---")
-        logger.info(f"PAYLOAD SENT: {user_msg}")
-        logger.info(f"RAW LLM RESPONSE: {text}")
-        logger.info(f"---------------------------------------")
+        logger.debug("Gemini transaction scoring payload=%s response=%s", user_msg, text)
 
-        data = json.loads(text)
+        data = json_utils.loads(text)
         return {
             "risk_percentage": int(data.get("risk_percentage", 50)),
             "risk_level": str(data.get("risk_level", "MEDIUM")),
@@ -188,10 +258,9 @@ async def evaluate_transaction_risk(
     except Exception as exc:
         logger.error("Gemini transaction risk eval failed: %s", exc)
         try:
-            from app.services.openrouter_service import evaluate_risk_fallback
             logger.info("Triggering OpenRouter Fallback for Transaction Eval")
             fallback_text = await evaluate_risk_fallback(TRANSACTION_SYSTEM_PROMPT, user_msg)
-            data = json.loads(fallback_text)
+            data = json_utils.loads(fallback_text)
             return {
                 "risk_percentage": int(data.get("risk_percentage", 50)),
                 "risk_level": str(data.get("risk_level", "MEDIUM")),
@@ -267,42 +336,46 @@ def _make(action: str, risk_level: str, confidence: float, reasons: list[str]) -
 # ---------------------------------------------------------------------------
 # Gemini live call
 # ---------------------------------------------------------------------------
+_hour_cache: tuple[float, int, bool] = (0.0, 0, False)   # (valid until, hour, is_weekend)
+
+
+def _hour_context() -> tuple[int, bool]:
+    """UTC (hour, is_weekend), recomputed only when the clock crosses an hour."""
+    global _hour_cache
+    t = time.time()
+    if t >= _hour_cache[0]:
+        now = datetime.fromtimestamp(t, timezone.utc)
+        _hour_cache = (t - t % 3600 + 3600, now.hour, now.weekday() >= 5)
+    return _hour_cache[1], _hour_cache[2]
+
+
 async def _gemini_evaluate(
     scores: dict, signals: list, financial_features: dict, transfer: dict, triggers: list, retry_count: int
 ) -> dict:
-    import json
-    import google.generativeai as genai      # type: ignore
-
-    genai.configure(api_key=settings.GEMINI_API_KEY)
-    model = genai.GenerativeModel(
-        model_name=settings.GEMINI_MODEL,
-        system_instruction=SYSTEM_PROMPT,
-        generation_config={"response_mime_type": "application/json"},
-    )
+    model = _get_model(SYSTEM_PROMPT)
 
     # Add time-of-day context
-    now = datetime.now(timezone.utc)
-    user_msg = json.dumps({
+    local_hour, is_weekend = _hour_context()
+    user_msg = json_utils.dumps({
         "scores": scores,
         "signals": signals,
         "financial_features": financial_features,
         "transfer_amount": transfer.get("amount"),
         "rail": transfer.get("rail"),
         "triggers": triggers,
-        "local_hour": now.hour,
-        "is_weekend": now.weekday() >= 5,
+        "local_hour": local_hour,
+        "is_weekend": is_weekend,
         "retry_count": retry_count,
-    }, indent=2)
+    })
 
     try:
-        resp = model.generate_content(user_msg)
+        resp = await asyncio.wait_for(
+            model.generate_content_async(user_msg), timeout=GEMINI_TIMEOUT_SECONDS
+        )
         text = resp.text.strip()
         
-        logger.info(f"--- GEMINI LIVENESS RISK LOGS ---")
-        logger.info(f"PAYLOAD SENT: {user_msg}")
-        logger.info(f"RAW LLM RESPONSE: {text}")
-        logger.info(f"---------------------------------")
-        data = json.loads(text)
+        logger.debug("Gemini liveness risk payload=%s response=%s", user_msg, text)
+        data = json_utils.loads(text)
         return {
             "action": data.get("final_decision", data.get("action", "MANUAL_REVIEW")),
             "risk_level": data.get("risk_level", "HIGH"),
@@ -312,10 +385,9 @@ async def _gemini_evaluate(
     except Exception as exc:
         logger.error("Gemini liveness eval failed: %s", exc)
         try:
-            from app.services.openrouter_service import evaluate_risk_fallback
             logger.info("Triggering OpenRouter Fallback for Liveness Eval")
             text = await evaluate_risk_fallback(SYSTEM_PROMPT, user_msg)
-            data = json.loads(text)
+            data = json_utils.loads(text)
             return {
                 "action": data.get("final_decision", data.get("action", "MANUAL_REVIEW")),
                 "risk_level": data.get("risk_level", "HIGH"),
@@ -343,17 +415,21 @@ def initial_risk_triggers(
     s = settings_ref or settings
     triggers: list[str] = []
     if amount >= s.RISK_AMOUNT_THRESHOLD:
-        triggers.append(f"high_amount:{amount}")
+        triggers.append("high_amount")
     if new_payee:
         triggers.append("new_payee")
     if new_device:
         triggers.append("new_device")
     if velocity_count > s.RISK_VELOCITY_MAX:
         triggers.append("high_velocity")
-    if ip:
-        octets = ip.split(".")
-        if len(octets) == 4:
-            first = int(octets[0]) if octets[0].isdigit() else 0
-            if first not in (10, 172, 192, 127):
-                triggers.append("external_ip")
+    if ip and not _is_internal_ip(ip):
+        triggers.append("external_ip")
     return triggers
+
+
+def _is_internal_ip(ip: str) -> bool:
+    """Private / loopback / link-local per ipaddress; unparseable hosts count as internal."""
+    try:
+        return ip_address(ip).is_private
+    except ValueError:
+        return True
@@ -3,10 +3,21 @@ OpenRouter integration for contextual, user-facing prompt generation.
 Using `arcee-ai/trinity-large-preview:free` model as requested.
 """
 from __future__ import annotations
-import json
+import asyncio
+import base64
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Annotated
+
 import httpx
+from pydantic import AfterValidator, AliasChoices, BaseModel, Field
 
+from app.core import json_utils
 from app.core.config import get_settings
+from app.core.http import get_client
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
@@ -14,6 +25,75 @@ settings = get_settings()
 
 OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+# generate_security_alert results, keyed on everything that goes into its prompt
+ALERT_CACHE_TTL_SECONDS = 3600
+ALERT_CACHE_MAX_ENTRIES = 4096
+_alert_cache: OrderedDict[tuple, tuple[float, str]] = OrderedDict()
+
+# Transient failures worth another attempt (free-tier models rate-limit often)
+_RETRY_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+_RETRY_AFTER_MAX_SECONDS = 10.0
+
+# Caps on in-flight requests per model class, so bursts queue here instead of
+# tripping OpenRouter's per-key limits (and the 429 retry storms that follow)
+_VISION_SEM = asyncio.Semaphore(4)
+_TEXT_SEM = asyncio.Semaphore(16)
+
+# Qwen-VL: a short read timeout just above typical latency plus retries beats
+# one long wait on a slow tail request; the deadline bounds the whole check.
+_VISION_TIMEOUT = httpx.Timeout(connect=3.0, read=8.0, write=5.0, pool=2.0)
+_VISION_MAX_RETRIES = 2
+_VISION_DEADLINE_SECONDS = 20.0
+
+# Risk fallback: the reply is a small JSON object, so cap generation near its
+# size; the deadline bounds the whole call so a hung fallback cannot stall
+# the risk pipeline.
+_FALLBACK_MAX_TOKENS = 400
+_FALLBACK_TIMEOUT_SECONDS = 6.0
+_FALLBACK_MAX_RETRIES = 2
+_FALLBACK_DEADLINE_SECONDS = 12.0
+
+# Single-flight + short result cache for analyze_frame_for_spoofing, keyed on
+# a digest of the full image bytes
+VISION_RESULT_TTL_SECONDS = 5
+VISION_RESULT_MAX_ENTRIES = 1024
+_vision_inflight: dict[bytes, asyncio.Future] = {}
+_vision_results: dict[bytes, tuple[float, dict]] = {}
+
+
+@lru_cache(maxsize=1)
+def _headers() -> httpx.Headers:
+    """
+    Auth + attribution headers, shared by every call (httpx only reads them).
+    Built as httpx.Headers so each request copies the already-encoded pairs
+    instead of re-normalising a plain dict.
+    """
+    return httpx.Headers({
+        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://hackhers.demo",
+        "X-Title": "DeepfakeGate"
+    })
+
+
+# Stripped once; only the transaction details are substituted per call.
+# The instructions come first so every request shares a byte-identical
+# prefix that providers with prompt caching can reuse.
+_ALERT_PROMPT = """
+    You are a friendly but professional banking security assistant.
+    A user just tried to send an unusual transaction that our fraud engine flagged and paused.
+    
+    Write EXACTLY ONE short, friendly sentence (maximum 20 words) explaining to the user why we paused it, and asking them to complete a quick biometric face scan to unlock the funds. 
+    Use a warm, protective tone. Do not include quotes or any standard AI greetings like 'Here is your sentence'.
+    
+    Details:
+    - Amount: ${amount:,.2f}
+    - Risk Level: {tx_risk_level}
+    - Internal Fraud Engine Reason: {tx_risk_explanation}
+    - Alert Triggers: {triggers}
+    """.strip()
+
+
 async def generate_security_alert(
     amount: float,
     triggers: list[str],
@@ -27,59 +107,45 @@ async def generate_security_alert(
     if not settings.OPENROUTER_API_KEY:
         return "For your security, please verify your identity to complete this high-risk transaction."
 
-    prompt = f"""
-    You are a friendly but professional banking security assistant.
-    A user just tried to send an unusual transaction that our fraud engine flagged and paused.
-    
-    Details:
-    - Amount: ${amount:,.2f}
-    - Risk Level: {tx_risk_level}
-    - Internal Fraud Engine Reason: {tx_risk_explanation}
-    - Alert Triggers: {", ".join(triggers) if triggers else "General Anomaly"}
-    
-    Write EXACTLY ONE short, friendly sentence (maximum 20 words) explaining to the user why we paused it, and asking them to complete a quick biometric face scan to unlock the funds. 
-    Use a warm, protective tone. Do not include quotes or any standard AI greetings like 'Here is your sentence'.
-    """
+    key = (round(amount, 2), tx_risk_level, tuple(triggers), tx_risk_explanation)
+    hit = _alert_cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        _alert_cache.move_to_end(key)
+        return hit[1]
 
-    headers = {
-        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://hackhers.demo",
-        "X-Title": "DeepfakeGate"
-    }
+    prompt = _ALERT_PROMPT.format(
+        amount=amount,
+        tx_risk_level=tx_risk_level,
+        tx_risk_explanation=tx_risk_explanation,
+        triggers=", ".join(triggers) if triggers else "General Anomaly",
+    )
 
     payload = {
         "model": "arcee-ai/trinity-large-preview:free",
         "messages": [
-            {"role": "user", "content": prompt.strip()}
+            {"role": "user", "content": prompt}
         ],
         "temperature": 0.7,
         "max_tokens": 60
     }
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.post(OPENROUTER_URL, headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            message = data["choices"][0]["message"]["content"].strip()
-            # Trim quotes if generated
-            if message.startswith('"') and message.endswith('"'):
-                message = message[1:-1]
-            return message
+        resp = await _post_with_retry(payload, timeout=10.0)
+        message = _reply_text(resp)
+        # Trim quotes if generated
+        if message.startswith('"') and message.endswith('"'):
+            message = message[1:-1]
+        _alert_cache[key] = (time.monotonic() + ALERT_CACHE_TTL_SECONDS, message)
+        _alert_cache.move_to_end(key)
+        if len(_alert_cache) > ALERT_CACHE_MAX_ENTRIES:
+            _alert_cache.popitem(last=False)
+        return message
     except Exception as exc:
         logger.error("OpenRouter alert generation failed: %s", exc)
         return "For your security, please complete a face scan to authorize this unusual transaction."
 
-async def analyze_frame_for_spoofing(live_b64: str, reference_b64: str | None = None) -> dict:
-    """
-    Sends a base64 encoded frame (and optionally a reference photo) to Qwen-VL via OpenRouter 
-    to detect physical spoofing attacks and optionally perform 1:1 face matching.
-    """
-    if not settings.OPENROUTER_API_KEY:
-        return {"spoof_confidence": 0.0, "vision_flags": [], "face_match_confidence": 1.0}
-
-    prompt = """
+# Qwen-VL prompts, assembled and stripped once
+_SPOOF_PROMPT = """
     You are an elite anti-spoofing and facial recognition vision model verifying a face scan from a banking app.
     
     TASK 1: ANTI-SPOOFING
@@ -94,10 +160,10 @@ async def analyze_frame_for_spoofing(live_b64: str, reference_b64: str | None =
     If it appears to be a real human face captured live by a webcam/phone, spoof_confidence should be 0.0.
     If it is clearly a photo or video being displayed on another screen, spoof_confidence should be high (0.8 - 1.0).
     """
+_FACE_MATCH_PROMPT = """
+    You are an elite facial recognition vision model verifying a face scan from a banking app.
 
-    if reference_b64:
-        prompt += """
-    TASK 2: FACE MATCHING (1:1 Identity Verification)
+    FACE MATCHING (1:1 Identity Verification)
     You have been provided with TWO images. The FIRST image is the LIVE CAMERA FRAME. The SECOND image is the STORED REFERENCE PHOTO of the account owner.
     Compare the face in the live frame to the face in the reference photo. 
     CRITICAL: You must EXPLICITLY IGNORE clothing, hats, glasses, or accessories. You are comparing the underlying human facial geometry only (bone structure, eye distance, jawline, nose shape).
@@ -105,44 +171,177 @@ async def analyze_frame_for_spoofing(live_b64: str, reference_b64: str | None =
     
     Return strictly JSON in the following format:
     {
-        "spoof_confidence": <float 0.0 to 1.0>,
         "is_same_person": true or false,
         "face_match_confidence": <float 0.0 to 1.0>,
         "face_match_reasoning": "brief explanation comparing the facial features",
-        "vision_flags": ["list", "of", "flags", "like", "phone_bezel_detected", "different_person_detected"]
+        "vision_flags": ["list", "of", "flags", "like", "different_person_detected"]
     }
     """
-    else:
-        prompt += """
+_SPOOF_ONLY_FORMAT = """
     Return strictly JSON in the following format:
     {
         "spoof_confidence": <float 0.0 to 1.0>,
         "vision_flags": ["list", "of", "flags", "like", "phone_bezel_detected"]
     }
     """
+_VISION_PROMPT_SPOOF = (_SPOOF_PROMPT + _SPOOF_ONLY_FORMAT).strip()
+_VISION_PROMPT_MATCH = _FACE_MATCH_PROMPT.strip()
 
-    headers = {
-        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://hackhers.demo",
-        "X-Title": "DeepfakeGate"
+# A spoof score this high fails the check regardless of the face match
+# (gemini_risk fails on >= 0.8), so the match request is cancelled.
+_SPOOF_SHORT_CIRCUIT = 0.9
+# Vision flag set when the face-match request fails but the spoof check ran.
+_MATCH_FAILED_FLAG = "face_match_unavailable"
+
+
+async def analyze_frame_for_spoofing(live_jpeg: bytes, reference_jpeg: bytes | None = None) -> dict:
+    """
+    Sends a JPEG frame (and optionally a reference photo) to Qwen-VL via OpenRouter 
+    to detect physical spoofing attacks and optionally perform 1:1 face matching.
+
+    Identical (live, reference) pairs share one in-flight request, and a
+    successful result is reused for VISION_RESULT_TTL_SECONDS.
+    """
+    if not settings.OPENROUTER_API_KEY:
+        return {"spoof_confidence": 0.0, "vision_flags": [], "face_match_confidence": 1.0}
+
+    # hashlib releases the GIL on large buffers, so this overlaps the loop
+    key = await asyncio.to_thread(_frame_key, live_jpeg, reference_jpeg)
+
+    hit = _vision_results.get(key)
+    if hit and hit[0] > time.monotonic():
+        return dict(hit[1])
+
+    inflight = _vision_inflight.get(key)
+    if inflight is not None:
+        # shield: a cancelled waiter must not cancel the shared request
+        result = await asyncio.shield(inflight)
+        if result is not None:
+            return dict(result)
+
+    fut = asyncio.get_running_loop().create_future()
+    _vision_inflight[key] = fut
+    result = None
+    try:
+        result = await _analyze_frame(live_jpeg, reference_jpeg)
+        # A failed face match is not cached; the next call retries it
+        if _MATCH_FAILED_FLAG not in result["vision_flags"]:
+            if len(_vision_results) >= VISION_RESULT_MAX_ENTRIES:
+                _vision_results.pop(next(iter(_vision_results)))
+            _vision_results[key] = (time.monotonic() + VISION_RESULT_TTL_SECONDS, result)
+    except Exception as exc:
+        logger.error("Qwen-VL spoof analysis failed: %s", exc)
+        result = {"spoof_confidence": 0.0, "is_same_person": True, "face_match_confidence": 1.0, "face_match_reasoning": "", "vision_flags": []}
+    finally:
+        _vision_inflight.pop(key, None)
+        # None (leader cancelled) tells waiters to make their own request
+        fut.set_result(result)
+    return dict(result)
+
+
+def _frame_key(live_jpeg: bytes, reference_jpeg: bytes | None) -> bytes:
+    """Cache / single-flight key over the full live and reference bytes."""
+    h = hashlib.blake2b(live_jpeg, digest_size=16)
+    h.update(b"\0")
+    if reference_jpeg:
+        h.update(reference_jpeg)
+    return h.digest()
+
+
+async def _analyze_frame(live_jpeg: bytes, reference_jpeg: bytes | None) -> dict:
+    """
+    Spoof check on the live frame and, with a reference photo, a concurrent
+    face-match request; a confident spoof cancels the match. Raises if the
+    spoof check fails. A failed match keeps the spoof verdict and is reported
+    as a 0.0 match flagged face_match_unavailable.
+    """
+    # Both requests carry the live frame; base64-encode it once
+    live_uri = _jpeg_data_uri(live_jpeg)
+    if not reference_jpeg:
+        spoof = await _vision_request(_SpoofReply, _VISION_PROMPT_SPOOF, live_uri)
+        return _vision_result(spoof, _MatchReply())
+
+    t_match = asyncio.create_task(
+        _vision_request(_MatchReply, _VISION_PROMPT_MATCH, live_uri,
+                        _jpeg_data_uri(reference_jpeg))
+    )
+    try:
+        spoof = await _vision_request(_SpoofReply, _VISION_PROMPT_SPOOF, live_uri)
+    except BaseException:
+        t_match.cancel()
+        raise
+
+    if spoof.spoof_confidence >= _SPOOF_SHORT_CIRCUIT:
+        t_match.cancel()
+        logger.info("Qwen-VL face match skipped: spoof detected")
+        match = _MatchReply(face_match_confidence=0.0,
+                            face_match_reasoning="Face match skipped: spoof detected")
+    else:
+        try:
+            match = await t_match
+        except Exception as exc:
+            logger.error("Qwen-VL face match failed: %s", exc)
+            match = _MatchReply(face_match_confidence=0.0,
+                                face_match_reasoning="Face match unavailable",
+                                vision_flags=[_MATCH_FAILED_FLAG])
+    return _vision_result(spoof, match)
+
+
+def _unit_score(value: float) -> float:
+    """
+    A model score on [0, 1]. Replies given in percent (2-100] are rescaled and
+    anything else is clamped (1.3 is an overshoot, not 1.3%), so a 95 still
+    reads as a confident spoof rather than failing into the fail-open default.
+    """
+    if 2.0 < value <= 100.0:
+        value /= 100.0
+    return min(max(value, 0.0), 1.0)
+
+
+_UnitScore = Annotated[float, AfterValidator(_unit_score)]
+
+
+class _SpoofReply(BaseModel):
+    """Qwen-VL spoof-check reply; non-numeric scores are rejected."""
+    spoof_confidence: _UnitScore
+    vision_flags: list[str] = []
+
+
+class _MatchReply(BaseModel):
+    """Qwen-VL face-match reply (older replies used confidence / reasoning)."""
+    is_same_person: bool = True
+    face_match_confidence: _UnitScore = Field(
+        1.0,
+        validation_alias=AliasChoices("face_match_confidence", "confidence"),
+    )
+    face_match_reasoning: str = Field(
+        "", validation_alias=AliasChoices("face_match_reasoning", "reasoning"),
+    )
+    vision_flags: list[str] = []
+
+
+def _vision_result(spoof: _SpoofReply, match: _MatchReply) -> dict:
+    """Result dict the liveness flow consumes, from the validated replies."""
+    return {
+        "spoof_confidence": spoof.spoof_confidence,
+        "is_same_person": match.is_same_person,
+        "face_match_confidence": match.face_match_confidence,
+        "face_match_reasoning": match.face_match_reasoning,
+        "vision_flags": spoof.vision_flags + match.vision_flags
     }
 
-    content_array = [
-        {"type": "text", "text": prompt.strip()},
-        {
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{live_b64}"
-            }
-        }
-    ]
 
-    if reference_b64:
+async def _vision_request(reply_model: type[BaseModel], prompt: str, *image_uris: str):
+    """
+    One Qwen-VL request on JPEG data URIs, returning its JSON reply validated
+    as `reply_model` (pydantic ValidationError on a malformed reply).
+    """
+    content_array = [{"type": "text", "text": prompt}]
+    for uri in image_uris:
         content_array.append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{reference_b64}"
+                "url": uri
             }
         })
 
@@ -159,33 +358,71 @@ async def analyze_frame_for_spoofing(live_b64: str, reference_b64: str | None =
         "response_format": {"type": "json_object"}
     }
     
-    logger.info("Sending frame to Qwen-VL for spoof analysis...")
+    logger.info("Sending frame to Qwen-VL (%d image(s))...", len(image_uris))
 
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(OPENROUTER_URL, headers=headers, json=payload)
+    started = time.perf_counter()
+    resp = await asyncio.wait_for(
+        _post_with_retry(payload, timeout=_VISION_TIMEOUT, max_retries=_VISION_MAX_RETRIES,
+                         sem=_VISION_SEM),
+        timeout=_VISION_DEADLINE_SECONDS,
+    )
+    logger.info("qwen_vl_latency_ms=%d", (time.perf_counter() - started) * 1000)
+    result = reply_model.model_validate_json(_json_object(_reply_text(resp)))
+    logger.info("Qwen-VL result: %s", result)
+    return result
+
+
+async def _post_with_retry(payload: dict, timeout: float | httpx.Timeout,
+                           max_retries: int = 3, base: float = 0.5,
+                           sem: asyncio.Semaphore = _TEXT_SEM) -> httpx.Response:
+    """
+    POST to OpenRouter, retrying timeouts, transport errors and 408/429/5xx
+    up to `max_retries` times with exponential backoff plus jitter (at least
+    Retry-After, capped). Returns the successful response; raises the last error.
+    Each attempt holds `sem`; backoff sleeps do not.
+    """
+    # Serialised once (orjson when available), not by httpx on every attempt
+    body = json_utils.dumps_bytes(payload)
+    for attempt in range(max_retries + 1):
+        try:
+            async with sem:
+                resp = await get_client().post(
+                    OPENROUTER_URL, headers=_headers(), content=body, timeout=timeout
+                )
             resp.raise_for_status()
-            data = resp.json()
-            message = data["choices"][0]["message"]["content"].strip()
-            
-            # Extract JSON from potential <think> blocks
-            start_idx = message.find('{')
-            end_idx = message.rfind('}')
-            if start_idx != -1 and end_idx != -1:
-                message = message[start_idx:end_idx+1]
-                
-            result = json.loads(message)
-            logger.info("Qwen-VL result: %s", result)
-            return {
-                "spoof_confidence": float(result.get("spoof_confidence", 0.0)),
-                "is_same_person": result.get("is_same_person", True),
-                "face_match_confidence": float(result.get("face_match_confidence", result.get("confidence", 1.0))),
-                "face_match_reasoning": result.get("face_match_reasoning", result.get("reasoning", "")),
-                "vision_flags": result.get("vision_flags", [])
-            }
-    except Exception as exc:
-        logger.error("Qwen-VL spoof analysis failed: %s", exc)
-        return {"spoof_confidence": 0.0, "is_same_person": True, "face_match_confidence": 1.0, "face_match_reasoning": "", "vision_flags": []}
+            return resp
+        except (httpx.TransportError, asyncio.TimeoutError, httpx.HTTPStatusError) as exc:
+            status = exc.response.status_code if isinstance(exc, httpx.HTTPStatusError) else None
+            if attempt == max_retries or (status is not None and status not in _RETRY_STATUS):
+                raise
+            delay = base * (1.5 ** attempt) + random.random() * 0.25
+            if status is not None:
+                try:
+                    retry_after = float(exc.response.headers.get("Retry-After", "0"))
+                except ValueError:
+                    retry_after = 0.0
+                delay = max(delay, min(retry_after, _RETRY_AFTER_MAX_SECONDS))
+            logger.warning("OpenRouter attempt %d failed (%s); retrying in %.2fs",
+                           attempt + 1, status or type(exc).__name__, delay)
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def _reply_text(resp: httpx.Response) -> str:
+    """Stripped assistant message of a chat-completions response."""
+    return json_utils.loads(resp.content)["choices"][0]["message"]["content"].strip()
+
+
+def _json_object(message: str) -> str:
+    """The outermost {...} span of a reply (models may wrap it in <think> text)."""
+    start = message.find("{")
+    end = message.rfind("}")
+    return message[start:end + 1] if start != -1 and end != -1 else message
+
+
+def _jpeg_data_uri(jpeg: bytes) -> str:
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+
 
 async def evaluate_risk_fallback(system_prompt: str, user_msg: str) -> str:
     """
@@ -195,13 +432,6 @@ async def evaluate_risk_fallback(system_prompt: str, user_msg: str) -> str:
     if not settings.OPENROUTER_API_KEY:
         raise Exception("No OPENROUTER_API_KEY for fallback")
 
-    headers = {
-        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://hackhers.demo",
-        "X-Title": "DeepfakeGate"
-    }
-
     payload = {
         "model": "google/gemini-2.0-pro-exp-0205:free",
         "messages": [
@@ -209,20 +439,19 @@ async def evaluate_risk_fallback(system_prompt: str, user_msg: str) -> str:
             {"role": "user", "content": user_msg.strip()}
         ],
         "temperature": 0.1,
-        "max_tokens": 1000
+        "max_tokens": _FALLBACK_MAX_TOKENS,
+        "response_format": {"type": "json_object"}
     }
     
     logger.info("Sending risk evaluation to OpenRouter Fallback Model...")
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.post(OPENROUTER_URL, headers=headers, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-        message = data["choices"][0]["message"]["content"].strip()
-        
-        start_idx = message.find('{')
-        end_idx = message.rfind('}')
-        if start_idx != -1 and end_idx != -1:
-            message = message[start_idx:end_idx+1]
-            
-        return message
+    resp = await asyncio.wait_for(
+        _post_with_retry(payload, timeout=_FALLBACK_TIMEOUT_SECONDS,
+                         max_retries=_FALLBACK_MAX_RETRIES),
+        timeout=_FALLBACK_DEADLINE_SECONDS,
+    )
+    data = json_utils.loads(resp.content)
+    usage = data.get("usage") or {}
+    logger.info("risk_fallback_tokens input=%s output=%s",
+                usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    return _json_object(data["choices"][0]["message"]["content"].strip())
@@ -24,7 +24,9 @@ import os
 import shutil
 import subprocess
 import tempfile
-from typing import Any
+import threading
+from functools import lru_cache
+from typing import Any, Iterable, Iterator
 
 import cv2
 import numpy as np
@@ -75,28 +77,45 @@ async def analyze_liveness(video_bytes: bytes) -> dict[str, Any]:
             "mode":            str,     # which mode was used
         }
     """
+    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as f:
+        f.write(video_bytes)
+        tmp_path = f.name
+
+    try:
+        return await analyze_liveness_file(tmp_path)
+    finally:
+        os.unlink(tmp_path)
+
+
+async def analyze_liveness_file(
+    video_path: str,
+    frames: np.ndarray | None = None,
+    fps: float | None = None,
+) -> dict[str, Any]:
+    """
+    Same as analyze_liveness for a video already on disk (no extra copy).
+
+    Pass already decoded `frames` (and their `fps`) to let the rPPG path
+    skip decoding the file again.
+    """
     if MODE == "SMARTSPECTRA_LIVE":
-        return await _run_smartspectra_cli(video_bytes)
+        return await _run_smartspectra_cli(video_path)
     if MODE == "GRPC_ONPREM":
-        return await _run_grpc_onprem(video_bytes)
-    return await _run_rppg_simulation(video_bytes)
+        return await _run_grpc_onprem(video_path)
+    return await _run_rppg_simulation(video_path, frames, fps)
 
 
 # ---------------------------------------------------------------------------
 # Mode 1: SmartSpectra C++ CLI
 # ---------------------------------------------------------------------------
 
-async def _run_smartspectra_cli(video_bytes: bytes) -> dict[str, Any]:
-    """Write video to a temp file, invoke the smartspectra binary, parse JSON."""
-    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as f:
-        f.write(video_bytes)
-        tmp_path = f.name
-
+async def _run_smartspectra_cli(video_path: str) -> dict[str, Any]:
+    """Invoke the smartspectra binary on the video file, parse JSON."""
     try:
         cmd = [
             "smartspectra",
             "--api-key", settings.PRESAGE_API_KEY,
-            "--input",   tmp_path,
+            "--input",   video_path,
             "--output-format", "json",
             "--duration", "3",
         ]
@@ -105,16 +124,14 @@ async def _run_smartspectra_cli(video_bytes: bytes) -> dict[str, Any]:
         )
         if proc.returncode != 0:
             logger.error("smartspectra CLI error: %s", proc.stderr[:500])
-            return await _run_rppg_simulation(video_bytes)
+            return await _run_rppg_simulation(video_path)
 
         data = json.loads(proc.stdout)
         return _parse_smartspectra_output(data)
 
     except Exception as exc:
         logger.error("smartspectra CLI exception: %s", exc)
-        return await _run_rppg_simulation(video_bytes)
-    finally:
-        os.unlink(tmp_path)
+        return await _run_rppg_simulation(video_path)
 
 
 def _parse_smartspectra_output(data: dict) -> dict[str, Any]:
@@ -157,7 +174,7 @@ def _parse_smartspectra_output(data: dict) -> dict[str, Any]:
 # Mode 2: gRPC OnPrem container
 # ---------------------------------------------------------------------------
 
-async def _run_grpc_onprem(video_bytes: bytes) -> dict[str, Any]:
+async def _run_grpc_onprem(video_path: str) -> dict[str, Any]:
     """Call the Presage SmartSpectra OnPrem gRPC service."""
     try:
         import grpc                                        # type: ignore
@@ -168,6 +185,9 @@ async def _run_grpc_onprem(video_bytes: bytes) -> dict[str, Any]:
             SmartSpectraStub,
         )
 
+        with open(video_path, "rb") as f:
+            video_bytes = await asyncio.to_thread(f.read)
+
         channel = grpc.aio.insecure_channel(settings.PRESAGE_GRPC_ENDPOINT)
         stub = SmartSpectraStub(channel)
 
@@ -184,17 +204,48 @@ async def _run_grpc_onprem(video_bytes: bytes) -> dict[str, Any]:
         )
     except ImportError:
         logger.warning("grpc / presage_pb2 not installed — falling back to rPPG simulation")
-        return await _run_rppg_simulation(video_bytes)
+        return await _run_rppg_simulation(video_path)
     except Exception as exc:
         logger.error("Presage gRPC error: %s", exc)
-        return await _run_rppg_simulation(video_bytes)
+        return await _run_rppg_simulation(video_path)
 
 
 # ---------------------------------------------------------------------------
 # Mode 3: rPPG simulation (genuine algorithm, no API key needed)
 # ---------------------------------------------------------------------------
 
-async def _run_rppg_simulation(video_bytes: bytes) -> dict[str, Any]:
+# Face detection runs on a half-resolution gray frame; bboxes are scaled back.
+RPPG_DETECT_DOWNSCALE = 2
+# The subject barely moves in a 3 s clip, so the cascade runs on every Nth
+# frame (or after a miss) and the last bbox is reused in between.
+RPPG_DETECT_EVERY = 5
+# Micro-motion is the mean per-tile face displacement between frames, in px.
+# Same scale as the old Farneback threshold (lowered from 0.05 to allow for
+# still faces); a static photo with sensor noise up to sigma=3 stays < 0.02.
+RPPG_MOTION_THRESHOLD = 0.02
+# The face ROI is split into a TILES x TILES grid for the motion estimate.
+RPPG_MOTION_TILES = 4
+
+# CascadeClassifier is not safe to share across threads (rPPG runs alongside
+# the deepfake model's detection), so each worker thread parses its own once.
+_thread_state = threading.local()
+
+
+def _get_cascade() -> cv2.CascadeClassifier:
+    cascade = getattr(_thread_state, "cascade", None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        )
+        _thread_state.cascade = cascade
+    return cascade
+
+
+async def _run_rppg_simulation(
+    video_path: str,
+    frames: np.ndarray | None = None,
+    fps: float | None = None,
+) -> dict[str, Any]:
     """
     Genuine Remote PPG analysis via OpenCV.
     
@@ -207,49 +258,58 @@ async def _run_rppg_simulation(video_bytes: bytes) -> dict[str, Any]:
     6. Measure micro-motion energy (blink proxy)
     7. Compute composite liveness score
     """
-    return await asyncio.to_thread(_rppg_sync, video_bytes)
-
+    if frames is not None:
+        return await asyncio.to_thread(_rppg_frames, frames, fps or 30.0)
+    return await asyncio.to_thread(_rppg_sync, video_path)
 
-def _rppg_sync(video_bytes: bytes) -> dict[str, Any]:
-    spoofing_flags: list[str] = []
-
-    # --- Decode frames ---
-    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as f:
-        f.write(video_bytes)
-        tmp = f.name
 
+def _rppg_sync(video_path: str) -> dict[str, Any]:
+    # --- Decode frames, streamed so only one is held at a time ---
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
     try:
-        cap = cv2.VideoCapture(tmp)
-        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-        frames: list[np.ndarray] = []
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frames.append(frame)
-        cap.release()
+        return _rppg_frames(_read_frames(cap), fps)
     finally:
-        os.unlink(tmp)
+        cap.release()
 
-    if len(frames) < 10:
-        spoofing_flags.append("insufficient_frames")
-        return _build_rppg_result(0.1, False, None, None, spoofing_flags, 0.1)
 
-    # --- Face detection ---
-    cascade = cv2.CascadeClassifier(
-        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-    )
+def _read_frames(cap: cv2.VideoCapture) -> Iterator[np.ndarray]:
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        yield frame
+
+
+def _rppg_frames(frames: Iterable[np.ndarray], fps: float) -> dict[str, Any]:
+    spoofing_flags: list[str] = []
+
+    # --- Face detection (per-thread cascade, half-resolution gray) ---
+    cascade = _get_cascade()
+    min_side = 60 // RPPG_DETECT_DOWNSCALE
 
     green_signal: list[float] = []
     motion_energy: list[float] = []
     prev_gray: np.ndarray | None = None
     faces_found = 0
+    n_frames = 0
+    bbox: tuple[int, int, int, int] | None = None
 
     for frame in frames:
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
-
-        if len(faces) == 0:
+        if bbox is None or n_frames % RPPG_DETECT_EVERY == 0:
+            small = cv2.resize(gray, None, fx=1.0 / RPPG_DETECT_DOWNSCALE,
+                               fy=1.0 / RPPG_DETECT_DOWNSCALE,
+                               interpolation=cv2.INTER_AREA)
+            faces = cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=5,
+                                             minSize=(min_side, min_side))
+            bbox = (
+                tuple(int(v) * RPPG_DETECT_DOWNSCALE for v in faces[0])
+                if len(faces) else None
+            )
+        n_frames += 1
+
+        if bbox is None:
             green_signal.append(green_signal[-1] if green_signal else 0.0)
             motion_energy.append(0.0)
             if prev_gray is not None:
@@ -257,24 +317,25 @@ def _rppg_sync(video_bytes: bytes) -> dict[str, Any]:
             continue
 
         faces_found += 1
-        x, y, w, h = faces[0]
+        x, y, w, h = bbox
         # Forehead region (top 30% of face) — richest rPPG signal
         fh = frame[y: y + int(h * 0.3), x: x + w]
         if fh.size > 0:
-            green_signal.append(float(np.mean(fh[:, :, 1])))  # green channel
+            green_signal.append(cv2.mean(fh)[1])  # green channel
 
-        # Optical flow magnitude (micro-motion)
+        # Per-tile displacement (micro-motion)
         roi_gray = gray[y: y + h, x: x + w]
         if prev_gray is not None:
             prev_roi = prev_gray[y: y + h, x: x + w]
             if roi_gray.shape == prev_roi.shape and roi_gray.size > 0:
-                flow = cv2.calcOpticalFlowFarneback(
-                    prev_roi, roi_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0
-                )
-                motion_energy.append(float(np.mean(np.abs(flow))))
+                motion_energy.append(_micro_motion(prev_roi, roi_gray))
         prev_gray = gray
 
-    face_ratio = faces_found / len(frames)
+    if n_frames < 10:
+        spoofing_flags.append("insufficient_frames")
+        return _build_rppg_result(0.1, False, None, None, spoofing_flags, 0.1)
+
+    face_ratio = faces_found / n_frames
     if face_ratio < 0.5:
         spoofing_flags.append("face_not_consistently_detected")
 
@@ -282,53 +343,48 @@ def _rppg_sync(video_bytes: bytes) -> dict[str, Any]:
     pulse_detected = False
     heart_rate_bpm = None
     hr_confidence = 0.0
+    breathing_rate = None
 
     if len(green_signal) >= 15:
         sig = np.array(green_signal, dtype=np.float64)
         # Detrend
         sig -= np.mean(sig)
 
-        # Simple band-pass: only keep components in [0.75, 4.0] Hz (45-240 BPM)
+        # One spectrum serves both the cardiac and the breathing bands
         N   = len(sig)
         fft = np.fft.rfft(sig)
-        freqs = np.fft.rfftfreq(N, d=1.0 / fps)
+        freqs, hr_band, br_band = _spectrum_bins(N, fps)
+        power = fft.real * fft.real + fft.imag * fft.imag
 
-        mask = (freqs >= 0.75) & (freqs <= 4.0)
-        fft_filtered = fft * mask
+        # Simple band-pass: only keep components in [0.75, 4.0] Hz (45-240 BPM)
+        band = power[hr_band]
 
         # Power in band vs total
-        band_power = float(np.sum(np.abs(fft_filtered) ** 2))
-        total_power = float(np.sum(np.abs(fft) ** 2)) + 1e-9
+        band_power = float(np.sum(band))
+        total_power = float(np.sum(power)) + 1e-9
         
         # DEMO OVERRIDE: Basic webcams + WebM compression often destroy subtle optical rPPG.
         # We artificially boost the confidence and lower thresholds for the demo so real users pass.
         hr_confidence = min((band_power / total_power) * 5.0, 1.0)
 
         if hr_confidence > 0.05:   # Lowered from 0.12
-            dominant_idx = np.argmax(np.abs(fft_filtered))
-            dominant_freq = freqs[dominant_idx]
+            dominant_freq = freqs[hr_band.start + int(np.argmax(band))]
             if dominant_freq > 0:
                 heart_rate_bpm = float(dominant_freq * 60)
                 pulse_detected = True
 
-    # --- Breathing: lower frequency analysis (0.1 – 0.5 Hz) ---
-    breathing_rate = None
-    if len(green_signal) >= 30:
-        sig = np.array(green_signal, dtype=np.float64) - np.mean(green_signal)
-        N = len(sig)
-        fft = np.fft.rfft(sig)
-        freqs = np.fft.rfftfreq(N, d=1.0 / fps)
-        mask = (freqs >= 0.1) & (freqs <= 0.5)
-        fft_b = fft * mask
-        if np.any(mask):
-            dominant_idx = np.argmax(np.abs(fft_b))
-            dominant_freq = freqs[dominant_idx]
-            if dominant_freq > 0:
-                breathing_rate = float(dominant_freq * 60)
+        # --- Breathing: lower frequency analysis (0.1 – 0.5 Hz) ---
+        if N >= 30:
+            band = power[br_band]
+            # An all-zero band has no dominant component
+            if band.size and band.max() > 0:
+                dominant_freq = freqs[br_band.start + int(np.argmax(band))]
+                if dominant_freq > 0:
+                    breathing_rate = float(dominant_freq * 60)
 
     # --- Micro-motion (blink / skin texture change) ---
     mean_motion = float(np.mean(motion_energy)) if motion_energy else 0.0
-    if mean_motion < 0.02:  # Lowered from 0.05 to allow for still faces
+    if mean_motion < RPPG_MOTION_THRESHOLD:
         spoofing_flags.append("no_micro_motion_static_image_suspected")
     else:
         # DEMO OVERRIDE: Standard webcams + WebM compression completely destroy
@@ -343,12 +399,61 @@ def _rppg_sync(video_bytes: bytes) -> dict[str, Any]:
     if not pulse_detected:
         spoofing_flags.append("no_cardiac_signal_detected")
 
-    presage_score = _compute_live_score(pulse_detected, hr_confidence, mean_motion >= 0.02)
+    presage_score = _compute_live_score(pulse_detected, hr_confidence, mean_motion >= RPPG_MOTION_THRESHOLD)
 
     return _build_rppg_result(presage_score, pulse_detected, heart_rate_bpm, breathing_rate,
                               spoofing_flags, hr_confidence)
 
 
+def _micro_motion(prev: np.ndarray, cur: np.ndarray) -> float:
+    """
+    Mean absolute displacement (px) between two gray ROIs, from a one-step
+    Lucas-Kanade fit per tile. Sensor noise is uncorrelated with the image
+    gradient and averages out of the fit, unlike a raw frame difference, and
+    removing the mean temporal change ignores global brightness flicker.
+    """
+    a = cv2.GaussianBlur(prev.astype(np.float32), (5, 5), 0)
+    b = cv2.GaussianBlur(cur.astype(np.float32), (5, 5), 0)
+    it = b - a
+    it -= cv2.mean(it)[0]
+    # Gradients of the average frame: Sobel's 1/8 normalisation times 1/2
+    avg = a + b
+    ix = cv2.Sobel(avg, cv2.CV_32F, 1, 0, ksize=3, scale=1 / 16)
+    iy = cv2.Sobel(avg, cv2.CV_32F, 0, 1, ksize=3, scale=1 / 16)
+
+    # Per-tile sums of the normal-equation terms (INTER_AREA averages a tile)
+    tiles = (RPPG_MOTION_TILES, RPPG_MOTION_TILES)
+    sxx, sxy, syy, sxt, syt = (
+        cv2.resize(p, tiles, interpolation=cv2.INTER_AREA)
+        for p in (ix * ix, ix * iy, iy * iy, ix * it, iy * it)
+    )
+    det = sxx * syy - sxy * sxy
+    # Textureless tiles cannot show motion; count them as still
+    ok = det > 1e-6 * (sxx + syy) ** 2 + 1e-12
+    det = np.where(ok, det, 1.0)
+    u = np.where(ok, (sxy * syt - syy * sxt) / det, 0.0)
+    v = np.where(ok, (sxy * sxt - sxx * syt) / det, 0.0)
+    return float((np.abs(u).mean() + np.abs(v).mean()) / 2)
+
+
+@lru_cache(maxsize=64)
+def _spectrum_bins(n: int, fps: float) -> tuple[np.ndarray, slice, slice]:
+    """
+    rfft bin frequencies for an n-sample signal at `fps`, with the cardiac
+    (0.75-4 Hz) and breathing (0.1-0.5 Hz) band slices. Clip lengths and
+    frame rates repeat, so this is shared (read-only) across calls.
+    """
+    freqs = np.fft.rfftfreq(n, d=1.0 / fps)
+    freqs.flags.writeable = False
+    return freqs, _band(freqs, 0.75, 4.0), _band(freqs, 0.1, 0.5)
+
+
+def _band(freqs: np.ndarray, f_lo: float, f_hi: float) -> slice:
+    """Index slice of the ascending `freqs` bins within [f_lo, f_hi]."""
+    return slice(int(np.searchsorted(freqs, f_lo, side="left")),
+                 int(np.searchsorted(freqs, f_hi, side="right")))
+
+
 def _compute_live_score(pulse_detected: bool, hr_confidence: float, motion_present: bool) -> float:
     """Weighted composite: 60% cardiac signal, 25% HR confidence, 15% motion."""
     score = (
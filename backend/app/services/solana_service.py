@@ -9,18 +9,55 @@ MVP uses "delayed submission" for escrow:
  - anchor_verification_receipt: sends a Memo tx containing hash metadata.
 """
 from __future__ import annotations
+import asyncio
 import hashlib
 import json
 import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
 from app.core.config import get_settings
 from app.core.logging import get_logger
 from app.core.security import generate_id
 
+try:
+    import base58                                             # type: ignore
+    from solana.rpc.async_api import AsyncClient              # type: ignore
+    from solders.instruction import AccountMeta, Instruction  # type: ignore
+    from solders.keypair import Keypair                       # type: ignore
+    from solders.message import Message                       # type: ignore
+    from solders.pubkey import Pubkey                         # type: ignore
+    from solders.transaction import Transaction               # type: ignore
+except ImportError:
+    AsyncClient = None
+
 logger = get_logger(__name__)
 settings = get_settings()
 
-# In-memory pending transfer registry (keyed by solana_pending_id)
-_pending: dict[str, dict] = {}
+# Memo program v1
+MEMO_PROGRAM_ID = "MemoSq4gqABAXKb96qnH8TysNcWxMyWCqXgDLGmfcHr"
+
+_rpc: Optional["AsyncClient"] = None
+
+# A blockhash stays valid for ~150 slots (60-90 s); reuse one well inside that
+# instead of paying an RPC round-trip per memo. Memos are unique per transfer
+# or receipt, so reuse does not produce duplicate signatures.
+BLOCKHASH_TTL_SECONDS = 45
+_blockhash: Optional[tuple[float, object]] = None
+_blockhash_lock = asyncio.Lock()
+
+# In-memory pending transfer registry (keyed by solana_pending_id), LRU-capped
+# so settled transfers do not accumulate for the life of the process
+PENDING_MAX_ENTRIES = 100_000
+_pending: OrderedDict[str, dict] = OrderedDict()
+
+
+def _touch(pending_id: str) -> dict | None:
+    entry = _pending.get(pending_id)
+    if entry is not None:
+        _pending.move_to_end(pending_id)
+    return entry
 
 
 # ---------------------------------------------------------------------------
@@ -32,6 +69,8 @@ async def create_pending_transfer(
 ) -> tuple[str, str | None]:
     """Returns (solana_pending_id, tx_sig_or_None)."""
     pending_id = generate_id("sol_")
+    if len(_pending) >= PENDING_MAX_ENTRIES:
+        _pending.popitem(last=False)
     _pending[pending_id] = {
         "user_id": user_id,
         "amount": amount,
@@ -51,7 +90,7 @@ async def create_pending_transfer(
 
 async def execute_pending_transfer(pending_id: str) -> str | None:
     """Execute (send SOL) and return tx signature."""
-    entry = _pending.get(pending_id)
+    entry = _touch(pending_id)
     if not entry:
         logger.warning("[SOLANA] pending_id not found: %s", pending_id)
         return None
@@ -65,7 +104,7 @@ async def execute_pending_transfer(pending_id: str) -> str | None:
 
 
 async def cancel_pending_transfer(pending_id: str) -> str | None:
-    entry = _pending.get(pending_id)
+    entry = _touch(pending_id)
     if not entry:
         return None
     entry["status"] = "CANCELLED"
@@ -107,31 +146,58 @@ async def anchor_verification_receipt(
 # ---------------------------------------------------------------------------
 # Internal: send Memo transaction via solana-py
 # ---------------------------------------------------------------------------
+@lru_cache(maxsize=1)
+def _payer() -> "Keypair":
+    """Payer keypair, base58-decoded once per process."""
+    return Keypair.from_bytes(base58.b58decode(settings.SOLANA_PAYER_KEYPAIR))
+
+
+@lru_cache(maxsize=1)
+def _memo_program() -> "Pubkey":
+    return Pubkey.from_string(MEMO_PROGRAM_ID)
+
+
+def _get_rpc() -> "AsyncClient":
+    """Process-wide async RPC client (pooled connections), created on first use."""
+    global _rpc
+    if _rpc is None:
+        _rpc = AsyncClient(settings.SOLANA_RPC_URL)
+    return _rpc
+
+
+async def close_rpc() -> None:
+    """Close the shared RPC client (FastAPI shutdown)."""
+    global _rpc
+    if _rpc is not None:
+        await _rpc.close()
+        _rpc = None
+
+
+async def _recent_blockhash(client: "AsyncClient"):
+    """Cached latest blockhash; one coroutine refreshes it when it expires."""
+    global _blockhash
+    if _blockhash is not None and _blockhash[0] > time.monotonic():
+        return _blockhash[1]
+    async with _blockhash_lock:
+        if _blockhash is None or _blockhash[0] <= time.monotonic():
+            resp = await client.get_latest_blockhash()
+            _blockhash = (time.monotonic() + BLOCKHASH_TTL_SECONDS, resp.value.blockhash)
+        return _blockhash[1]
+
+
 async def _send_memo(memo_text: str) -> str | None:
+    global _blockhash
+    if AsyncClient is None:
+        logger.warning("[SOLANA] solana-py not installed; returning None")
+        return None
     try:
-        from solders.keypair import Keypair       # type: ignore
-        from solders.pubkey import Pubkey         # type: ignore
-        from solders.transaction import Transaction  # type: ignore
-        from solders.instruction import Instruction, AccountMeta  # type: ignore
-        from solders.hash import Hash             # type: ignore
-        from solders.message import Message       # type: ignore
-        import solana.rpc.api as rpc_api          # type: ignore
-        import base58                             # type: ignore
-
-        # Load payer keypair
-        secret_bytes = base58.b58decode(settings.SOLANA_PAYER_KEYPAIR)
-        payer = Keypair.from_bytes(secret_bytes)
-
-        # Memo program v1
-        MEMO_PROGRAM_ID = Pubkey.from_string("MemoSq4gqABAXKb96qnH8TysNcWxMyWCqXgDLGmfcHr")
-
-        client = rpc_api.Client(settings.SOLANA_RPC_URL)
-        blockhash_resp = client.get_latest_blockhash()
-        recent_blockhash = blockhash_resp.value.blockhash
+        payer = _payer()
+        client = _get_rpc()
+        recent_blockhash = await _recent_blockhash(client)
 
         memo_bytes = memo_text.encode("utf-8")
         ix = Instruction(
-            program_id=MEMO_PROGRAM_ID,
+            program_id=_memo_program(),
             accounts=[AccountMeta(pubkey=payer.pubkey(), is_signer=True, is_writable=False)],
             data=memo_bytes,
         )
@@ -139,12 +205,11 @@ async def _send_memo(memo_text: str) -> str | None:
             [ix], payer.pubkey(), recent_blockhash
         )
         tx = Transaction([payer], msg, recent_blockhash)
-        resp = client.send_transaction(tx)
+        resp = await client.send_transaction(tx)
         return str(resp.value)
 
-    except ImportError:
-        logger.warning("[SOLANA] solana-py not installed; returning None")
-        return None
     except Exception as exc:
+        # The cached blockhash may be the cause (expired / not found); refetch next time
+        _blockhash = None
         logger.error("[SOLANA] send_memo error: %s", exc)
         return None
@@ -0,0 +1,63 @@
+"""
+Optional numba kernels for the optical-flow reductions in liveness /
+presage scoring. Each kernel is None when numba is not installed and
+callers fall back to plain NumPy.
+"""
+try:
+    from numba import njit              # type: ignore
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+
+    @njit(cache=True, inline="always")
+    def _grad(a, i, n, a_prev, a_next):
+        # Matches np.gradient: one-sided at the edges, central inside.
+        if i == 0:
+            return a_next - a
+        if i == n - 1:
+            return a - a_prev
+        return (a_next - a_prev) * 0.5
+
+    @njit(cache=True, fastmath=True)
+    def nonrigid_sums(fx, fy):
+        """
+        Single pass over a flow field returning
+        (sum|divergence|, sum|curl|, sum|fx|, sum|fy|).
+        """
+        h, w = fx.shape
+        div_sum = 0.0
+        curl_sum = 0.0
+        fx_sum = 0.0
+        fy_sum = 0.0
+        for y in range(h):
+            yp = y - 1 if y > 0 else y
+            yn = y + 1 if y < h - 1 else y
+            for x in range(w):
+                xp = x - 1 if x > 0 else x
+                xn = x + 1 if x < w - 1 else x
+                dfx_dy = _grad(fx[y, x], y, h, fx[yp, x], fx[yn, x])
+                dfy_dx = _grad(fy[y, x], x, w, fy[y, xp], fy[y, xn])
+                dfy_dy = _grad(fy[y, x], y, h, fy[yp, x], fy[yn, x])
+                dfx_dx = _grad(fx[y, x], x, w, fx[y, xp], fx[y, xn])
+                div_sum += abs(dfx_dy + dfy_dx)
+                curl_sum += abs(dfy_dy - dfx_dx)
+                fx_sum += abs(fx[y, x])
+                fy_sum += abs(fy[y, x])
+        return div_sum, curl_sum, fx_sum, fy_sum
+
+    # Serial on purpose: these run on analyze_video_bytes' stage threads, and
+    # numba's default workqueue layer cannot launch parallel kernels from
+    # several threads at once.
+    @njit(cache=True, fastmath=True)
+    def mean_abs_diff(a, b):
+        """mean(|a - b|) over two equally shaped flattened arrays."""
+        total = 0.0
+        for i in range(a.size):
+            total += abs(a[i] - b[i])
+        return total / a.size
+
+else:
+    nonrigid_sums = None
+    mean_abs_diff = None
@@ -5,6 +5,10 @@ import os
 from typing import Optional
 
 
+# Upper bound on the up-front frame allocation, whatever the container claims.
+_MAX_PREALLOC_FRAMES = 300
+
+
 def _get_suffix(video_bytes: bytes) -> str:
     # WebM magic number
     if video_bytes.startswith(b'\x1a\x45\xdf\xa3'):
@@ -19,41 +23,93 @@ def decode_video_bytes(video_bytes: bytes) -> tuple[bool, Optional[np.ndarray],
     Returns:
         tuple: (success, frames_array, signals)
     """
-    signals = []
-    
     suffix = _get_suffix(video_bytes)
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
         tmp_file.write(video_bytes)
         tmp_path = tmp_file.name
     
     try:
-        cap = cv2.VideoCapture(tmp_path)
+        return decode_video_file(tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def decode_video_file(path: str) -> tuple[bool, Optional[np.ndarray], list[str]]:
+    """
+    Decode a video file on disk using OpenCV.
+    
+    Returns:
+        tuple: (success, frames_array, signals)
+    """
+    success, frames, signals, _ = decode_video(path)
+    return success, frames, signals
+
+
+def decode_video(path: str) -> tuple[bool, Optional[np.ndarray], list[str], float]:
+    """
+    Decode a video file once so the result can be shared by every consumer.
+    
+    Returns:
+        tuple: (success, frames_array, signals, fps) — fps falls back to 30.0
+    """
+    signals = []
+    fps = 30.0
+    
+    try:
+        cap = cv2.VideoCapture(path)
         
         if not cap.isOpened():
-            os.unlink(tmp_path)
-            return False, None, ["decode_failed"]
+            return False, None, ["decode_failed"], fps
         
-        frames = []
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        ret, first = cap.read()
+        if not ret:
+            cap.release()
+            signals.append("no_frames")
+            return False, None, signals, fps
+
+        # Decode straight into one (N, H, W, 3) block instead of stacking a
+        # list of frames afterwards. WebM often reports no or a wrong frame
+        # count, so once the block is full the next frame is read into a
+        # scratch buffer and the block only doubles if that read succeeds.
+        reported = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        capacity = min(max(reported, 1), _MAX_PREALLOC_FRAMES)
+        frames = np.empty((capacity,) + first.shape, dtype=first.dtype)
+        frames[0] = first
+        scratch = first  # already copied into the block
+        n = 1
         while True:
-            ret, frame = cap.read()
+            full = n == len(frames)
+            slot = scratch if full else frames[n]
+            ret, frame = cap.read(slot)
             if not ret:
                 break
-            frames.append(frame)
+            if full:
+                grown = np.empty((2 * n,) + first.shape, dtype=first.dtype)
+                grown[:n] = frames
+                frames = grown
+                frames[n] = frame
+            elif frame is not slot:
+                frames[n] = frame  # decoder allocated its own buffer
+            n += 1
         
         cap.release()
-        os.unlink(tmp_path)
-        
-        if len(frames) == 0:
-            signals.append("no_frames")
-            return False, None, signals
+
+        if n < len(frames):
+            # Compact so the result does not keep the larger block alive
+            frames = frames[:n].copy()
         
-        return True, np.array(frames), signals
+        return True, frames, signals, fps
         
     except Exception as e:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
         signals.append(f"decode_error: {str(e)}")
-        return False, None, signals
+        return False, None, signals, fps
+
+
+def sniff_suffix(first_chunk: bytes) -> str:
+    """File suffix for a video whose first bytes are `first_chunk`."""
+    return _get_suffix(first_chunk)
 
 
 def get_video_info(video_bytes: bytes) -> dict:
@@ -1,16 +1,28 @@
+import os
+
 import cv2
 import numpy as np
 from typing import Optional
 
+from app.video import _kernels
+
+# Route Farneback / Haar through OpenCV's T-API (cv2.UMat) when an OpenCL
+# device is present; everything stays on plain ndarrays otherwise.
+USE_OPENCL = cv2.ocl.haveOpenCL()
+if USE_OPENCL:
+    cv2.ocl.setUseOpenCL(True)
+
+# Uploads run OpenCV on several threads at once (asyncio.to_thread, the
+# video-stage pool, rPPG); cap OpenCV's own parallel_for pool so the
+# per-call stripes do not oversubscribe the cores.
+cv2.setNumThreads(max(2, (os.cpu_count() or 2) // 2))
 
-def compute_optical_flow(prev_frame: np.ndarray, curr_frame: np.ndarray) -> np.ndarray:
-    """Compute dense optical flow between two frames."""
-    if prev_frame is None or curr_frame is None:
+
+def compute_optical_flow(prev_gray: np.ndarray, curr_gray: np.ndarray) -> np.ndarray:
+    """Compute dense optical flow between two grayscale frames."""
+    if prev_gray is None or curr_gray is None:
         return np.array([])
     
-    prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-    curr_gray = cv2.cvtColor(curr_frame, cv2.COLOR_BGR2GRAY)
-    
     flow = cv2.calcOpticalFlowFarneback(
         prev_gray, curr_gray,
         None,
@@ -25,6 +37,88 @@ def compute_optical_flow(prev_frame: np.ndarray, curr_frame: np.ndarray) -> np.n
     return flow
 
 
+def face_flow_region(
+    face_bboxes: list[Optional[tuple]],
+    frame_shape: tuple,
+    pad: float = 0.2
+) -> Optional[tuple[int, int, int, int]]:
+    """
+    Union of all detected face boxes, padded and clipped to the frame.
+
+    A single region is used for every pair so the cropped flows share a
+    shape and can still be differenced for smoothness.
+
+    Returns:
+        tuple: (x0, y0, x1, y1) or None if no face was detected
+    """
+    boxes = [b for b in face_bboxes if b is not None]
+    if not boxes:
+        return None
+
+    h_frame, w_frame = frame_shape[:2]
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes)
+    y1 = max(b[1] + b[3] for b in boxes)
+
+    pad_x = int((x1 - x0) * pad)
+    pad_y = int((y1 - y0) * pad)
+    x0, y0 = max(0, x0 - pad_x), max(0, y0 - pad_y)
+    x1, y1 = min(w_frame, x1 + pad_x), min(h_frame, y1 + pad_y)
+
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return None
+    return x0, y0, x1, y1
+
+
+def compute_pairwise_flows(
+    grays: list[np.ndarray],
+    face_bboxes: list[Optional[tuple]],
+    downscale: int = 1
+) -> list[np.ndarray]:
+    """
+    Compute Farneback flow on the face crop for every consecutive pair of
+    grayscale frames.
+
+    Shared by liveness and presage scoring so each pair is only solved once.
+    Pairs where either frame has no face get an empty array.
+
+    Args:
+        grays: Grayscale frames, optionally reduced by `downscale`
+        face_bboxes: Face boxes in full-resolution coordinates
+        downscale: Factor the grays were reduced by; flow vectors are scaled
+            back up so they stay in full-resolution pixels
+    """
+    if len(grays) < 2:
+        return []
+
+    h, w = grays[0].shape[:2]
+    region = face_flow_region(face_bboxes, (h * downscale, w * downscale))
+    flows = []
+    for i in range(len(grays) - 1):
+        if region is None or face_bboxes[i] is None or face_bboxes[i + 1] is None:
+            flows.append(np.array([]))
+            continue
+        x0, y0, x1, y1 = (v // downscale for v in region)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            flows.append(np.array([]))
+            continue
+        prev_crop, curr_crop = grays[i][y0:y1, x0:x1], grays[i + 1][y0:y1, x0:x1]
+        if USE_OPENCL:
+            prev_crop = cv2.UMat(np.ascontiguousarray(prev_crop))
+            curr_crop = cv2.UMat(np.ascontiguousarray(curr_crop))
+        # Smaller window / fewer levels: the crop spans a narrower scale range
+        flow = cv2.calcOpticalFlowFarneback(
+            prev_crop, curr_crop, None, 0.5, 2, 11, 3, 5, 1.2, 0
+        )
+        if isinstance(flow, cv2.UMat):
+            flow = flow.get()
+        if downscale != 1:
+            flow *= downscale
+        flows.append(flow)
+    return flows
+
+
 def compute_motion_magnitude(flow: np.ndarray) -> float:
     """Compute average motion magnitude from optical flow."""
     if flow.size == 0:
@@ -44,14 +138,22 @@ def compute_non_rigid_ratio(flow: np.ndarray) -> float:
     
     flow_x, flow_y = flow[..., 0], flow[..., 1]
     
-    grad_x = np.gradient(flow_x, axis=0)
-    grad_y = np.gradient(flow_y, axis=1)
-    
-    divergence = grad_x + grad_y
-    curl = np.gradient(flow_y, axis=0) - np.gradient(flow_x, axis=1)
-    
-    non_rigid_energy = np.mean(np.abs(divergence)) + np.mean(np.abs(curl))
-    global_flow = np.mean(np.abs(flow_x)) + np.mean(np.abs(flow_y))
+    if _kernels.nonrigid_sums is not None:
+        n = flow_x.size
+        div_sum, curl_sum, fx_sum, fy_sum = _kernels.nonrigid_sums(
+            np.ascontiguousarray(flow_x), np.ascontiguousarray(flow_y)
+        )
+        non_rigid_energy = (div_sum + curl_sum) / n
+        global_flow = (fx_sum + fy_sum) / n
+    else:
+        grad_x = np.gradient(flow_x, axis=0)
+        grad_y = np.gradient(flow_y, axis=1)
+        
+        divergence = grad_x + grad_y
+        curl = np.gradient(flow_y, axis=0) - np.gradient(flow_x, axis=1)
+        
+        non_rigid_energy = np.mean(np.abs(divergence)) + np.mean(np.abs(curl))
+        global_flow = np.mean(np.abs(flow_x)) + np.mean(np.abs(flow_y))
     
     if global_flow == 0:
         return 0.5
@@ -64,7 +166,8 @@ def compute_non_rigid_ratio(flow: np.ndarray) -> float:
 def compute_liveness_score(
     frames: list[np.ndarray],
     face_bboxes: list[Optional[tuple]],
-    motion_threshold: float = 2.0
+    motion_threshold: float = 2.0,
+    flows: Optional[list[np.ndarray]] = None
 ) -> tuple[float, list[str]]:
     """
     Compute liveness score based on motion compliance and non-rigid motion.
@@ -73,6 +176,7 @@ def compute_liveness_score(
         frames: List of sampled frames
         face_bboxes: List of face bounding boxes (x, y, w, h) or None
         motion_threshold: Minimum motion to consider as responsive
+        flows: Precomputed flow for each consecutive frame pair (optional)
     
     Returns:
         tuple: (liveness_score, signals)
@@ -105,20 +209,17 @@ def compute_liveness_score(
     else:
         avg_displacement = 0
     
+    if flows is None:
+        flows = compute_pairwise_flows(
+            [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames], face_bboxes
+        )
+    
     non_rigid_ratios = []
-    for i in range(len(frames) - 1):
-        roi_current = None
-        for j, bbox in enumerate(face_bboxes[i+1:]):
-            if bbox is not None:
-                x, y, w, h = bbox
-                roi_current = frames[i+1][y:y+h, x:x+w]
-                break
-        
-        if roi_current is not None and roi_current.size > 0:
-            flow = compute_optical_flow(frames[i], frames[i+1])
-            if flow.size > 0:
-                non_rigid = compute_non_rigid_ratio(flow)
-                non_rigid_ratios.append(non_rigid)
+    for flow in flows:
+        if flow.size > 0:
+            non_rigid_ratios.append(compute_non_rigid_ratio(flow))
+        else:
+            non_rigid_ratios.append(0.5)  # no face in pair → neutral
     
     if not non_rigid_ratios:
         non_rigid_ratios = [0.5]
@@ -1,29 +1,42 @@
 import cv2
 import numpy as np
-from typing import Optional
+from typing import Optional, Union
+
+from app.video import _kernels
+from app.video.liveness import compute_pairwise_flows
 
 
 def compute_micro_motion_energy(roi: np.ndarray) -> float:
     """
     Compute micro-motion energy within cheeks/forehead region.
     Real faces have subtle micro-motions.
+    
+    Accepts a BGR ROI or an already grayscale one.
     """
     if roi is None or roi.size == 0:
         return 0.0
     
     h, w = roi.shape[:2]
     
-    forehead_roi = roi[int(h*0.1):int(h*0.35), int(w*0.25):int(w*0.75)]
-    left_cheek_roi = roi[int(h*0.5):int(h*0.75), int(w*0.1):int(w*0.35)]
-    right_cheek_roi = roi[int(h*0.5):int(h*0.75), int(w*0.65):int(w*0.9)]
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if len(roi.shape) == 3 else roi
+    # One integral / squared-integral pass; each region's variance is then
+    # E[x^2] - E[x]^2 from four corners of each table.
+    sums, sq_sums = cv2.integral2(np.ascontiguousarray(gray), sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
     
-    regions = [forehead_roi, left_cheek_roi, right_cheek_roi]
+    regions = [
+        (int(h*0.1), int(h*0.35), int(w*0.25), int(w*0.75)),   # forehead
+        (int(h*0.5), int(h*0.75), int(w*0.1), int(w*0.35)),    # left cheek
+        (int(h*0.5), int(h*0.75), int(w*0.65), int(w*0.9)),    # right cheek
+    ]
     energies = []
     
-    for region in regions:
-        if region.size > 0:
-            gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY) if len(region.shape) == 3 else region
-            variance = np.var(gray)
+    for y0, y1, x0, x1 in regions:
+        n = (y1 - y0) * (x1 - x0)
+        if n > 0:
+            total = sums[y1, x1] - sums[y0, x1] - sums[y1, x0] + sums[y0, x0]
+            sq_total = sq_sums[y1, x1] - sq_sums[y0, x1] - sq_sums[y1, x0] + sq_sums[y0, x0]
+            mean = total / n
+            variance = max(sq_total / n - mean * mean, 0.0)
             energies.append(min(variance / 1000.0, 1.0))
     
     return np.mean(energies) if energies else 0.0
@@ -45,8 +58,10 @@ def compute_motion_smoothness(flows: list[np.ndarray]) -> float:
         if flow_curr.size == 0 or flow_next.size == 0:
             continue
         
-        diff = np.abs(flow_curr - flow_next)
-        jitter = np.mean(diff)
+        if _kernels.mean_abs_diff is not None:
+            jitter = _kernels.mean_abs_diff(flow_curr.ravel(), flow_next.ravel())
+        else:
+            jitter = np.mean(np.abs(flow_curr - flow_next))
         
         smoothness = max(0.0, 1.0 - jitter / 5.0)
         smoothness_scores.append(smoothness)
@@ -54,46 +69,61 @@ def compute_motion_smoothness(flows: list[np.ndarray]) -> float:
     return np.mean(smoothness_scores) if smoothness_scores else 0.5
 
 
-def compute_periodicity_proxy(frames: list[np.ndarray]) -> float:
+def compute_periodicity_proxy(frames: Union[list[np.ndarray], np.ndarray]) -> float:
     """
     Compute periodicity proxy using mean green channel changes.
     Screen replays may show periodic patterns.
+    
+    Accepts a list of frames or a stacked (N, H, W, C) array.
     """
     if len(frames) < 3:
         return 0.0
     
-    green_means = []
-    for frame in frames:
-        if frame is not None and frame.size > 0:
-            green_channel = frame[:, :, 1] if len(frame.shape) == 3 else frame
-            green_means.append(np.mean(green_channel))
+    if isinstance(frames, np.ndarray) and frames.ndim == 4:
+        # Stacked (N, H, W, C) frames: one reduction over the whole green slab
+        green_means = frames[..., 1].mean(axis=(1, 2))
+    else:
+        green_means = []
+        for frame in frames:
+            if frame is not None and frame.size > 0:
+                green_channel = frame[:, :, 1] if len(frame.shape) == 3 else frame
+                green_means.append(np.mean(green_channel))
     
     if len(green_means) < 3:
         return 0.0
     
-    green_means = np.array(green_means)
+    green_means = np.asarray(green_means)
     differences = np.diff(green_means)
     
-    autocorr = np.correlate(differences, differences, mode='full')
-    autocorr = autocorr[len(autocorr)//2:]
+    # Non-negative lags of the full autocorrelation, via rFFT (zero-padded
+    # to 2N so the circular correlation matches the linear one).
+    n = len(differences)
+    spectrum = np.fft.rfft(differences, n=2 * n)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), n=2 * n)[:n]
     
     if len(autocorr) > 2:
-        peaks = np.where((autocorr[1:-1] > autocorr[:-2]) & (autocorr[1:-1] > autocorr[2:]))[0]
+        peaks = np.flatnonzero((autocorr[1:-1] > autocorr[:-2]) & (autocorr[1:-1] > autocorr[2:])) + 1
         if len(peaks) > 0:
-            periodicity = np.mean(autocorr[peaks + 1]) / (np.var(differences) + 1e-6)
+            periodicity = np.mean(autocorr[peaks]) / (np.var(differences) + 1e-6)
             return min(periodicity / 10.0, 1.0)
     
     return 0.0
 
 
 def compute_presage_features(
-    frames: list[np.ndarray],
+    frames: Union[list[np.ndarray], np.ndarray],
     rois: list[Optional[np.ndarray]],
-    face_bboxes: list[Optional[tuple]]
+    face_bboxes: list[Optional[tuple]],
+    flows: Optional[list[np.ndarray]] = None,
+    gray_rois: Optional[list[Optional[np.ndarray]]] = None
 ) -> tuple[float, dict, list[str]]:
     """
     Compute Presage-like human sensing score.
     
+    Pass `flows` (one per consecutive frame pair) to reuse optical flow
+    already computed for liveness scoring, and `gray_rois` (grayscale crops
+    matching `rois`) to skip converting the face regions again.
+    
     Returns:
         tuple: (presage_score, presage_raw_dict, signals)
     """
@@ -107,20 +137,16 @@ def compute_presage_features(
     face_presence_ratio = frames_with_face / total_frames
     
     micro_motions = []
-    for roi in rois:
+    for roi in (gray_rois if gray_rois is not None else rois):
         if roi is not None and roi.size > 0:
             micro_motions.append(compute_micro_motion_energy(roi))
     
     micro_motion = np.mean(micro_motions) if micro_motions else 0.0
     
-    flows = []
-    for i in range(len(frames) - 1):
-        flow = cv2.calcOpticalFlowFarneback(
-            cv2.cvtColor(frames[i], cv2.COLOR_BGR2GRAY),
-            cv2.cvtColor(frames[i+1], cv2.COLOR_BGR2GRAY),
-            None, 0.5, 3, 15, 3, 5, 1.2, 0
+    if flows is None:
+        flows = compute_pairwise_flows(
+            [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames], face_bboxes
         )
-        flows.append(flow)
     
     smoothness = compute_motion_smoothness(flows)
     periodicity_proxy = compute_periodicity_proxy(frames)
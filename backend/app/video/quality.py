@@ -12,8 +12,10 @@ def compute_blur_score(roi: np.ndarray) -> float:
         return 0.0
     
     gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if len(roi.shape) == 3 else roi
-    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-    variance = laplacian.var()
+    # 8-bit input gives small integer responses, exact in float32;
+    # meanStdDev accumulates in double
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+    variance = float(cv2.meanStdDev(laplacian)[1][0, 0]) ** 2
     
     # Lowered from 500 to 150 to be more forgiving for webcams
     normalized = min(variance / 150.0, 1.0)
@@ -29,7 +31,7 @@ def compute_brightness_score(roi: np.ndarray) -> float:
         return 0.0
     
     gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if len(roi.shape) == 3 else roi
-    mean_intensity = np.mean(gray)
+    mean_intensity = cv2.mean(gray)[0]
     
     # Widened from 80-180 to 50-200 to allow dimmer/brighter indoor lighting
     optimal_low, optimal_high = 50, 200
@@ -56,7 +58,7 @@ def compute_quality_score(
     face_presence_weight: float = 0.3
 ) -> tuple[float, list[str]]:
     """
-    Compute overall quality score from face ROIs.
+    Compute overall quality score from face ROIs (BGR or already gray).
     
     Returns:
         tuple: (quality_score, signals)
@@ -17,6 +17,9 @@ def sample_frames(
     
     Returns:
         tuple: (sampled_frames, frame_indices, signals)
+    
+    The sampled frames are a strided view into `frames`, not a copy;
+    callers must not write through it.
     """
     signals = []
     total_frames = len(frames)
@@ -30,7 +33,8 @@ def sample_frames(
         indices = indices[:max_frames]
         signals.append("max_frames_limited")
     
-    sampled = frames[indices]
+    # Indices are an arithmetic progression, so basic slicing gives a view
+    sampled = frames[:indices[-1] + 1:sample_interval]
     
     if len(sampled) < 3:
         signals.append("low_frame_count")
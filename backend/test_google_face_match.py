@@ -19,9 +19,14 @@ def encode_image(image_path: str) -> str:
         print(f"Error: Image not found at {image_path}")
         sys.exit(1)
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        return base64.b64encode(image_file.read()).decode('ascii')
 
-async def compare_faces(ref_image_path: str, live_image_path: str):
+async def compare_faces(ref_image_path: str, live_image_path: str,
+                        client: httpx.AsyncClient | None = None):
+    """
+    Ask Qwen-VL whether the two photos show the same person. Pass a shared
+    `client` when comparing many pairs so connections (and TLS) are reused.
+    """
     ref_b64 = encode_image(ref_image_path)
     live_b64 = encode_image(live_image_path)
 
@@ -75,27 +80,34 @@ async def compare_faces(ref_image_path: str, live_image_path: str):
     
     print(f"Sending images to OpenRouter using {model}...")
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            
-            message = data["choices"][0]["message"]["content"].strip()
+        if client is None:
+            async with httpx.AsyncClient(timeout=30.0) as own_client:
+                resp = await _post(own_client, headers, payload)
+        else:
+            resp = await _post(client, headers, payload)
+        data = resp.json()
+        
+        message = data["choices"][0]["message"]["content"].strip()
+        
+        # Clean markdown if present
+        if message.startswith("```json"):
+            message = message[7:-3].strip()
+        elif message.startswith("```"):
+            message = message[3:-3].strip()
             
-            # Clean markdown if present
-            if message.startswith("```json"):
-                message = message[7:-3].strip()
-            elif message.startswith("```"):
-                message = message[3:-3].strip()
-                
-            result = json.loads(message)
-            print("\n--- OPENROUTER RESULT ---")
-            print(json.dumps(result, indent=2))
-            print("-------------------------\n")
+        result = json.loads(message)
+        print("\n--- OPENROUTER RESULT ---")
+        print(json.dumps(result, indent=2))
+        print("-------------------------\n")
         
     except Exception as e:
         print(f"Error calling OpenRouter: {e}")
 
+async def _post(client: httpx.AsyncClient, headers: dict, payload: dict) -> httpx.Response:
+    resp = await client.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=payload)
+    resp.raise_for_status()
+    return resp
+
 if __name__ == "__main__":
     if len(sys.argv) < 3:
         print("Usage: python test_google_face_match.py <reference_img_path> <live_img_path>")